@@ -1,17 +1,29 @@
+"""
+Web process: Slack events, the Google OAuth callback, Calendar push notifications,
+/metrics and the profiler's /admin/profile. Nothing here polls calendars; that is
+worker.py. Importing this module opens no connections, so it is safe to serve with
+several workers:
+
+    gunicorn --workers 4 --bind 0.0.0.0:8080 app:flask_app
+"""
+import hmac
 import os
-from flask import Flask, request, redirect
+import threading
+from flask import Flask, Response, g, request, redirect
 from slack_bolt import App
 from slack_bolt.adapter.flask import SlackRequestHandler
 import jwt
 
 from config import Config
-from database import Database
+from database import CALENDAR_CHANGED_CHANNEL, PROFILE_CHANNEL, USER_CONNECTED_CHANNEL, USER_DORMANT_CHANNEL, Database
 from google_calendar import GoogleCalendar
-from scheduler import MeetingScheduler
+from calendar_push import CalendarWatchManager
+from home_tab import HomeViewCache, build_home_view, is_connected
+from profiler import Profiler
+import metrics
 
 import logging
-# This line is added to get more detailed logs
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=Config.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
 from werkzeug.middleware.proxy_fix import ProxyFix # Add this line
@@ -22,11 +34,17 @@ flask_app.wsgi_app = ProxyFix(flask_app.wsgi_app, x_proto=1) # Add this line
 slack_app = App(
     token=Config.SLACK_BOT_TOKEN,
     signing_secret=Config.SLACK_SIGNING_SECRET,
+    # Skips the auth.test round-trip Bolt otherwise makes at import time in every worker.
+    token_verification_enabled=False,
 )
 slack_handler = SlackRequestHandler(slack_app)
 
-db = Database(Config.DB_HOST, Config.DB_NAME, Config.DB_USER, Config.DB_PASSWORD)
-db.connect()
+db = Database(
+    Config.DB_HOST, Config.DB_NAME, Config.DB_USER, Config.DB_PASSWORD,
+    min_size=1, max_size=Config.DB_POOL_MAX_SIZE,
+    checkout_timeout=Config.DB_POOL_TIMEOUT_SECONDS
+)
+_db_lock = threading.Lock()
 
 google_calendar_client = GoogleCalendar(
     Config.GOOGLE_CLIENT_ID,
@@ -35,57 +53,113 @@ google_calendar_client = GoogleCalendar(
     Config.GOOGLE_SCOPES
 )
 
-scheduler = MeetingScheduler(db, google_calendar_client, slack_app.client, Config)
-scheduler.start()
+# Connecting a calendar (or having it go dormant) changes what the home tab shows, so token
+# writes drop the cached view: right away in the process that saved them, and via
+# USER_CONNECTED_CHANNEL / USER_DORMANT_CHANNEL in every other one.
+home_views = HomeViewCache(ttl_seconds=Config.HOME_VIEW_CACHE_TTL_SECONDS)
+db.add_user_listener(home_views.invalidate)
+_listener_stop = threading.Event()
+
+def _on_notification(channel, slack_user_id):
+    home_views.invalidate(slack_user_id)
+
+watch_manager = CalendarWatchManager(db, google_calendar_client, Config)
+
+# Armed through POST /admin/profile. Under gunicorn only the worker that took that request is armed.
+profiler = Profiler(Config.PROFILE_OUTPUT_DIR, interval=Config.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+# Slack events are acked before their listener runs, so those are profiled in the listener instead.
+_UNPROFILED_ENDPOINTS = ("slack_events", "arm_profiler", "prometheus_metrics")
+
+@flask_app.before_request
+def _start_profile():
+    if profiler.armed and request.endpoint not in _UNPROFILED_ENDPOINTS:
+        g.profile = profiler.begin(f"request-{request.endpoint}")
+
+@flask_app.teardown_request
+def _stop_profile(exc):
+    profiler.end(g.pop("profile", None))
+
+@flask_app.before_request
+def _ensure_db():
+    # The pool opens on the first request, in the serving worker, not at import.
+    if db.pool:
+        return
+    with _db_lock:
+        if not db.pool:
+            db.connect()
+            threading.Thread(
+                target=db.listen,
+                args=((USER_CONNECTED_CHANNEL, USER_DORMANT_CHANNEL), _on_notification, _listener_stop),
+                name='pg-listener',
+                daemon=True
+            ).start()
 
 @slack_app.event("app_home_opened")
 def handle_app_home_opened(event, client, logger):
-    try:
-        user_id = event["user"]
-        user_data = db.get_user(slack_user_id=user_id)
-
-        blocks = []
-        if user_data and user_data.get('google_refresh_token'):
-            blocks.append({
-                "type": "section",
-                "text": { "type": "mrkdwn", "text": "Welcome back! Your Google Calendar is connected."}
-            })
-        else:
-            auth_url, state = google_calendar_client.get_auth_url(user_id)
-            blocks.extend([
-                {
-                    "type": "section",
-                    "text": { "type": "mrkdwn", "text": "👋 Hey there! To get started, I need access to your Google Calendar."}
-                },
-                {
-                    "type": "actions",
-                    "elements": [
-                        {
-                            "type": "button",
-                            "text": { "type": "plain_text", "text": "Connect Google Calendar"},
-                            "style": "primary",
-                            "url": auth_url,
-                            "action_id": "connect_google_calendar"
-                        }
-                    ]
-                },
-            ])
-
-        client.views_publish(
-            user_id=user_id,
-            view={
-                "type": "home",
-                "blocks": blocks
-            }
-        )
-    except Exception as e:
-        logger.error(f"Error in app_home_opened: {e}")
+    with profiler.session("app_home_opened"):
+        try:
+            user_id = event["user"]
+            if home_views.get(user_id) is not None:
+                return
+            user_data = db.get_user(slack_user_id=user_id)
+
+            auth_url = None
+            if not is_connected(user_data):
+                auth_url, _ = google_calendar_client.get_auth_url(user_id)
+
+            view = build_home_view(auth_url)
+            if not home_views.unchanged(user_id, view):
+                client.views_publish(user_id=user_id, view=view)
+            home_views.put(user_id, view)
+        except Exception as e:
+            logger.error(f"Error in app_home_opened: {e}")
 
 
 @flask_app.route("/slack/events", methods=["POST"])
 def slack_events():
     return slack_handler.handle(request)
 
+@flask_app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@flask_app.route("/admin/profile", methods=["POST"])
+def arm_profiler():
+    # Off unless ADMIN_TOKEN is set; callers send "Authorization: Bearer <ADMIN_TOKEN>".
+    authorization = request.headers.get("Authorization", "")
+    if not Config.ADMIN_TOKEN or not hmac.compare_digest(authorization, f"Bearer {Config.ADMIN_TOKEN}"):
+        return "", 404
+    runs = request.args.get("runs", Config.PROFILE_DEFAULT_RUNS, type=int)
+    target = request.args.get("target", "web")
+    if target == "web":
+        profiler.arm(runs)
+    elif target == "worker":
+        # Every scheduler worker listens on this channel and arms itself for its next ticks.
+        db.notify(PROFILE_CHANNEL, str(runs))
+    else:
+        return "target must be 'web' or 'worker'.", 400
+    return f"Profiling the next {runs} {target} runs; output goes to {Config.PROFILE_OUTPUT_DIR}.\n"
+
+@flask_app.route("/google/calendar/notifications", methods=["POST"])
+def google_calendar_notifications():
+    # Always 200: Google retries anything else, and there is nothing useful to tell it.
+    slack_user_id = watch_manager.handle_notification(request.headers)
+    if slack_user_id:
+        logger.info(f"Calendar change notification for {slack_user_id}, handing off to the scheduler.")
+        db.notify(CALENDAR_CHANGED_CHANNEL, slack_user_id)
+    return "", 200
+
+def _publish_connected_home(slack_user_id):
+    # A home tab left open on the connect button would otherwise keep showing it until reopened.
+    view = build_home_view()
+    try:
+        slack_app.client.views_publish(user_id=slack_user_id, view=view)
+    except Exception as e:
+        logger.warning(f"Could not publish home view for {slack_user_id}: {e}")
+        return
+    home_views.put(slack_user_id, view)
+
 @flask_app.route("/google_oauth_callback", methods=["GET"])
 def google_oauth_callback():
     # --- ADDED LOGGING HERE ---
@@ -120,6 +194,10 @@ def google_oauth_callback():
 
         if refresh_token:
             db.save_user_tokens(slack_user_id, slack_email, google_email, refresh_token, expiry_dt)
+            # The owning scheduler worker starts polling (and watching) the new user right away,
+            # and every web process drops its cached home view for them.
+            db.notify(USER_CONNECTED_CHANNEL, slack_user_id)
+            _publish_connected_home(slack_user_id)
             slack_app.client.chat_postMessage(channel=slack_user_id, text="✅ Google Calendar connected successfully!")
             return "Google Calendar connected successfully! You can close this tab."
         else:
@@ -0,0 +1,112 @@
+"""
+Async serving mode for Slack events.
+
+Runs the Slack side of the app on Bolt's AsyncApp under an ASGI server:
+
+    uvicorn async_app:app --host 0.0.0.0 --port 8080
+
+Bolt acknowledges each event as soon as its signature is verified and runs the listener
+as a task afterwards, so Slack gets its ack well inside 3 seconds however slow the
+listener is, and one event loop serves many home-tab opens concurrently. The DB lookup
+and views.publish are awaited rather than blocking a WSGI thread.
+
+This process only serves /slack/events and /metrics. The OAuth callback, Calendar push
+notifications and /admin/profile stay in app.py, and the reminder scheduler runs in
+worker.py, so point Slack's Event Subscriptions Request URL here and keep the rest
+routed to the Flask app.
+"""
+import asyncio
+import contextlib
+import logging
+
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.starlette.async_handler import AsyncSlackRequestHandler
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from async_database import AsyncDatabase
+from config import Config
+from database import USER_CONNECTED_CHANNEL, USER_DORMANT_CHANNEL
+from google_calendar import GoogleCalendar
+from home_tab import HomeViewCache, build_home_view, is_connected
+import metrics
+
+logging.basicConfig(level=Config.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+slack_app = AsyncApp(
+    token=Config.SLACK_BOT_TOKEN,
+    signing_secret=Config.SLACK_SIGNING_SECRET,
+)
+slack_handler = AsyncSlackRequestHandler(slack_app)
+
+db = AsyncDatabase(
+    Config.DB_HOST, Config.DB_NAME, Config.DB_USER, Config.DB_PASSWORD,
+    min_size=Config.DB_POOL_MIN_SIZE, max_size=Config.DB_POOL_MAX_SIZE
+)
+
+# Only used to build consent URLs, which is local work with no network call.
+google_calendar_client = GoogleCalendar(
+    Config.GOOGLE_CLIENT_ID,
+    Config.GOOGLE_CLIENT_SECRET,
+    Config.GOOGLE_REDIRECT_URI,
+    Config.GOOGLE_SCOPES
+)
+
+# Tokens are saved by the Flask app and the worker, which NOTIFY USER_CONNECTED_CHANNEL and
+# USER_DORMANT_CHANNEL; see lifespan.
+home_views = HomeViewCache(ttl_seconds=Config.HOME_VIEW_CACHE_TTL_SECONDS)
+
+def _on_notification(channel, slack_user_id):
+    home_views.invalidate(slack_user_id)
+
+@slack_app.event("app_home_opened")
+async def handle_app_home_opened(event, client, logger):
+    try:
+        user_id = event["user"]
+        if home_views.get(user_id) is not None:
+            return
+        user_data = await db.get_user(slack_user_id=user_id)
+
+        auth_url = None
+        if not is_connected(user_data):
+            auth_url, _ = google_calendar_client.get_auth_url(user_id)
+
+        view = build_home_view(auth_url)
+        if not home_views.unchanged(user_id, view):
+            await client.views_publish(user_id=user_id, view=view)
+        home_views.put(user_id, view)
+    except Exception as e:
+        logger.error(f"Error in app_home_opened: {e}")
+
+async def slack_events(request):
+    return await slack_handler.handle(request)
+
+async def prometheus_metrics(request):
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await db.connect()
+    listener = asyncio.create_task(db.listen((USER_CONNECTED_CHANNEL, USER_DORMANT_CHANNEL), _on_notification))
+    try:
+        yield
+    finally:
+        listener.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await listener
+        await db.close()
+
+app = Starlette(
+    routes=[
+        Route("/slack/events", endpoint=slack_events, methods=["POST"]),
+        Route("/metrics", endpoint=prometheus_metrics, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=8080)
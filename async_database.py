@@ -0,0 +1,79 @@
+import asyncio
+import asyncpg
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AsyncDatabase:
+    """
+    asyncpg-backed counterpart of Database for the async Slack app. Only the queries the
+    async handlers need live here; schema management stays with Database.
+    """
+    def __init__(self, host, dbname, user, password, min_size=1, max_size=10, command_timeout=10, port=None):
+        self.conn_params = {
+            "host": host,
+            "port": port,
+            "database": dbname,
+            "user": user,
+            "password": password,
+            "timeout": 10,
+            "command_timeout": command_timeout,
+        }
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+
+    async def connect(self):
+        """
+        Opens the connection pool.
+        """
+        try:
+            self.pool = await asyncpg.create_pool(min_size=self.min_size, max_size=self.max_size, **self.conn_params)
+            logger.info("Async database pool connected.")
+        except Exception as e:
+            logger.error(f"Error connecting to database: {e}")
+            self.pool = None
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+    async def get_user(self, slack_user_id=None, google_email=None):
+        """
+        Retrieves a user from the database by Slack user ID or Google email.
+        """
+        if not self.pool:
+            logger.error("Database not connected.")
+            return None
+        if slack_user_id:
+            row = await self.pool.fetchrow("SELECT * FROM users WHERE slack_user_id = $1", slack_user_id)
+        elif google_email:
+            row = await self.pool.fetchrow("SELECT * FROM users WHERE google_email = $1", google_email)
+        else:
+            return None
+        return dict(row) if row else None
+
+    async def listen(self, channels, callback, retry_seconds=5):
+        """
+        Calls callback(channel, payload) for each NOTIFY on channels until cancelled. Uses its
+        own connection rather than a pooled one, since LISTEN is per-connection state, and
+        reconnects if it drops.
+        """
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(**self.conn_params)
+                closed = asyncio.Event()
+                conn.add_termination_listener(lambda _conn: closed.set())
+                for channel in channels:
+                    await conn.add_listener(channel, lambda _conn, _pid, channel, payload: callback(channel, payload))
+                logger.info(f"Listening for notifications on {', '.join(channels)}.")
+                await closed.wait()
+                logger.error("Notification listener connection closed; reconnecting.")
+            except Exception as e:
+                logger.error(f"Notification listener connection failed: {e}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(retry_seconds)
@@ -0,0 +1,220 @@
+"""
+Offline load test for the reminder pipeline.
+
+Drives MeetingScheduler._check_and_send_reminders against a fake Calendar API, a fake
+Slack client and a real Postgres, at several user counts, and reports tick latency
+percentiles, Calendar API calls, DB queries and peak Python memory per tick.
+
+    python -m bench                                  # ephemeral Postgres via testing.postgresql
+    python -m bench --dsn "host=localhost dbname=bench user=postgres"
+    python -m bench --users 100,1000 --save-baseline bench/baseline.json
+    python -m bench --users 100,1000 --compare bench/baseline.json
+
+With --dsn the harness only touches rows whose slack_user_id starts with BENCH and
+removes them afterwards, but pointing it at a dedicated database is still recommended.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import sys
+import time
+import tracemalloc
+
+from config import Config
+from partitioning import WorkerMembership
+from scheduler import MeetingScheduler
+
+from bench.fakes import CallCounter, CountingDatabase, FakeCalendarBackend, FakeGoogleCalendar, FakeSlackClient
+
+USER_PREFIX = "BENCH"
+
+# Metrics compared against a saved baseline; all of them are "lower is better".
+COMPARED_METRICS = ('warm_tick_p95', 'api_calls_per_tick', 'db_queries_per_tick', 'peak_memory_mb')
+
+def _bench_config(args):
+    class BenchConfig(Config):
+        POLL_CONCURRENCY = args.concurrency
+        CALENDAR_INCREMENTAL_SYNC = not args.windowed
+        GOOGLE_WATCH_ADDRESS = None
+        # The fake Slack client has no rate limit, so neither should the delivery queue.
+        SLACK_CHANNEL_RATE_PER_SECOND = 1e9
+        SLACK_CHANNEL_BURST = 10 ** 9
+        DB_POOL_MAX_SIZE = args.concurrency + 4
+        # Each measured tick is a full sweep, so don't let the tick budget defer anyone.
+        TICK_BUDGET_SECONDS = float('inf')
+    return BenchConfig
+
+@contextlib.contextmanager
+def _postgres(dsn):
+    """Yields Database connection kwargs, starting a throwaway Postgres if no DSN is given."""
+    if dsn:
+        from psycopg2.extensions import parse_dsn
+        params = parse_dsn(dsn)
+        yield {
+            'host': params.get('host'), 'port': params.get('port'), 'dbname': params.get('dbname'),
+            'user': params.get('user'), 'password': params.get('password'),
+        }
+        return
+    try:
+        import testing.postgresql
+    except ImportError:
+        sys.exit("No --dsn given and testing.postgresql is not installed (pip install -r bench/requirements.txt).")
+    with testing.postgresql.Postgresql() as pg:
+        params = pg.dsn()
+        yield {
+            'host': params['host'], 'port': params['port'], 'dbname': params['database'],
+            'user': params['user'], 'password': None,
+        }
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def _seed_users(db, user_ids):
+    for slack_user_id in user_ids:
+        db.save_user_tokens(slack_user_id, f"{slack_user_id.lower()}@example.com", f"{slack_user_id.lower()}@example.com", "fake-refresh-token", None)
+
+def _cleanup(db):
+    with db._cursor() as cur:
+        # The bench scheduler posts to a channel named after USER_PREFIX too.
+        cur.execute("DELETE FROM sent_notifications WHERE channel_id LIKE %s", (USER_PREFIX + '%',))
+        cur.execute("DELETE FROM users WHERE slack_user_id LIKE %s", (USER_PREFIX + '%',))
+        cur.execute("DELETE FROM scheduler_workers WHERE worker_id LIKE %s", (USER_PREFIX + '%',))
+
+def _force_all_due(scheduler):
+    """Makes every user due now, so each tick is a full sweep (the worst case)."""
+    now = time.time()
+    for slack_user_id in scheduler._users:
+        scheduler.poll_queue.schedule(slack_user_id, now - 1)
+
+def run_scale(args, db_params, user_count):
+    counter = CallCounter()
+    config = _bench_config(args)
+    user_ids = [f"{USER_PREFIX}{i:06d}" for i in range(user_count)]
+
+    db = CountingDatabase(
+        counter=counter, min_size=1, max_size=config.DB_POOL_MAX_SIZE, checkout_timeout=30, **db_params
+    )
+    db.connect()
+    if not db.pool:
+        sys.exit("Could not connect to Postgres.")
+    db.create_tables()
+    _cleanup(db)
+    _seed_users(db, user_ids)
+
+    backend = FakeCalendarBackend(
+        user_ids, events_per_user=args.events_per_user, latency=args.api_latency_ms / 1000,
+        error_rate=args.error_rate, seed=args.seed, counter=counter
+    )
+    google_calendar = FakeGoogleCalendar(backend)
+    slack = FakeSlackClient(latency=args.slack_latency_ms / 1000, counter=counter)
+
+    scheduler = MeetingScheduler(db, google_calendar, slack, config)
+    scheduler.membership = WorkerMembership(db, worker_id=f"{USER_PREFIX}-worker")
+    scheduler.channel_id = f"{USER_PREFIX}-channel"
+    scheduler.delivery.start()
+    scheduler.membership.heartbeat()
+    scheduler._load_users(time.time())
+
+    latencies, api_calls, db_queries = [], [], []
+    try:
+        for _ in range(args.ticks):
+            _force_all_due(scheduler)
+            counter.reset()
+            started = time.perf_counter()
+            scheduler._check_and_send_reminders()
+            latencies.append(time.perf_counter() - started)
+            counts = counter.snapshot()
+            api_calls.append(counts.get('calendar.events.list', 0))
+            db_queries.append(counts.get('db.queries', 0))
+
+        # Memory is measured on an extra tick so tracing overhead doesn't skew the timings.
+        _force_all_due(scheduler)
+        tracemalloc.start()
+        scheduler._check_and_send_reminders()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        scheduler.executor.shutdown(wait=True)
+        scheduler.delivery.stop()
+        scheduler.membership.leave()
+        _cleanup(db)
+        db.close()
+
+    warm = latencies[1:] or latencies
+    return {
+        'users': user_count,
+        'cold_tick': latencies[0],
+        'warm_tick_p50': _percentile(warm, 50),
+        'warm_tick_p95': _percentile(warm, 95),
+        'warm_tick_p99': _percentile(warm, 99),
+        'api_calls_first_tick': api_calls[0],
+        'api_calls_per_tick': sum(api_calls[1:] or api_calls) / len(api_calls[1:] or api_calls),
+        'db_queries_per_tick': sum(db_queries[1:] or db_queries) / len(db_queries[1:] or db_queries),
+        'peak_memory_mb': peak_bytes / (1024 * 1024),
+        'slack_posts': len(slack.posts),
+    }
+
+def _print_results(results):
+    columns = ('users', 'cold_tick', 'warm_tick_p50', 'warm_tick_p95', 'warm_tick_p99',
+               'api_calls_first_tick', 'api_calls_per_tick', 'db_queries_per_tick', 'peak_memory_mb', 'slack_posts')
+    print(" ".join(f"{c:>20}" for c in columns))
+    for result in results:
+        print(" ".join(f"{result[c]:>20.3f}" if isinstance(result[c], float) else f"{result[c]:>20}" for c in columns))
+
+def _compare(results, baseline_path, tolerance):
+    """Returns a list of regressions against the saved baseline."""
+    with open(baseline_path) as f:
+        baseline = {entry['users']: entry for entry in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        base = baseline.get(result['users'])
+        if not base:
+            continue
+        for metric in COMPARED_METRICS:
+            if base[metric] and result[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{result['users']} users: {metric} {result[metric]:.3f} vs baseline {base[metric]:.3f}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", default="100,1000,10000", help="comma-separated user counts")
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--events-per-user", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=Config.POLL_CONCURRENCY)
+    parser.add_argument("--api-latency-ms", type=float, default=0.0)
+    parser.add_argument("--slack-latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--windowed", action="store_true", help="use windowed fetches instead of incremental sync")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--dsn", help="libpq DSN of an existing Postgres to use")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH", help="fail if results regress against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression for --compare")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    results = []
+    with _postgres(args.dsn) as db_params:
+        for user_count in (int(n) for n in args.users.split(",")):
+            results.append(run_scale(args, db_params, user_count))
+    _print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        regressions = _compare(results, args.compare, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+In-process stand-ins for Google Calendar, Slack and a query-counting Database, used by
+the benchmark harness to drive MeetingScheduler without network access or real tokens.
+"""
+import collections
+import contextlib
+import datetime
+import random
+import threading
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from database import Database
+from google_calendar import GoogleCalendar
+
+class CallCounter:
+    """Thread-safe named counters shared by the fakes."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+def _rfc3339(ts):
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+class FakeCalendarBackend:
+    """
+    Seeded synthetic calendars. Each user gets events_per_user events spread over the
+    next 24 hours; a fraction of them are shared with other users to mimic real meetings.
+    change_rate is the chance per incremental sync that one of the user's events changes.
+    """
+    def __init__(self, users, events_per_user=20, latency=0.0, error_rate=0.0, change_rate=0.05, seed=1234, counter=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.change_rate = change_rate
+        self.counter = counter or CallCounter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._calendars = {}
+        self._versions = collections.Counter()
+
+        now = int(time.time())
+        shared = [self._event(f"shared-{i}", now) for i in range(max(1, len(users) // 10))]
+        for slack_user_id in users:
+            events = {}
+            for i in range(events_per_user):
+                if self._random.random() < 0.2:
+                    event = dict(self._random.choice(shared))
+                else:
+                    event = self._event(f"{slack_user_id}-{i}", now)
+                events[event['id']] = event
+            self._calendars[slack_user_id] = events
+
+    def _event(self, event_id, now):
+        start = now + self._random.randrange(0, 24 * 3600, 300)
+        attendees = [
+            {'email': f"person{self._random.randrange(500)}@example.com", 'responseStatus': 'accepted'}
+            for _ in range(self._random.randrange(1, 12))
+        ]
+        attendees.append({'email': 'me@example.com', 'self': True, 'responseStatus': 'accepted'})
+        return {
+            'id': event_id,
+            'iCalUID': f"{event_id}@google.com",
+            'status': 'confirmed',
+            'summary': f"Meeting {event_id}",
+            'start': {'dateTime': _rfc3339(start)},
+            'end': {'dateTime': _rfc3339(start + 1800)},
+            'attendees': attendees,
+            'htmlLink': f"https://calendar.google.com/event?eid={event_id}",
+        }
+
+    def service_for(self, slack_user_id):
+        return _FakeService(self, slack_user_id)
+
+    def list_events(self, slack_user_id, params):
+        self.counter.incr('calendar.events.list')
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.counter.incr('calendar.errors')
+            raise HttpError(httplib2.Response({'status': 503}), b'fake backend error')
+
+        with self._lock:
+            events = self._calendars.get(slack_user_id, {})
+            if params.get('syncToken'):
+                changed = []
+                if self._random.random() < self.change_rate and events:
+                    event = dict(self._random.choice(list(events.values())))
+                    event['summary'] += ' (updated)'
+                    events[event['id']] = event
+                    changed.append(event)
+                items = changed
+            else:
+                time_min = params.get('timeMin')
+                time_max = params.get('timeMax')
+                items = [e for e in events.values() if self._overlaps(e, time_min, time_max)]
+            self._versions[slack_user_id] += 1
+            version = self._versions[slack_user_id]
+
+        page_size = params.get('maxResults') or 250
+        offset = int(params.get('pageToken') or 0)
+        page = items[offset:offset + page_size]
+        result = {'items': page}
+        if offset + page_size < len(items):
+            result['nextPageToken'] = str(offset + page_size)
+        else:
+            result['nextSyncToken'] = f"sync-{slack_user_id}-{version}"
+        return result
+
+    @staticmethod
+    def _overlaps(event, time_min, time_max):
+        start = event['start']['dateTime']
+        # Both sides are UTC RFC 3339 strings, so comparing them as text is enough here.
+        if time_max and start > _normalise(time_max):
+            return False
+        if time_min and event['end']['dateTime'] < _normalise(time_min):
+            return False
+        return True
+
+def _normalise(value):
+    return datetime.datetime.fromisoformat(value).astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+class _FakeRequest:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self):
+        return self._fn()
+
+class _FakeEvents:
+    def __init__(self, backend, slack_user_id):
+        self._backend = backend
+        self._slack_user_id = slack_user_id
+
+    def list(self, **params):
+        return _FakeRequest(lambda: self._backend.list_events(self._slack_user_id, params))
+
+class _FakeService:
+    def __init__(self, backend, slack_user_id):
+        self._events = _FakeEvents(backend, slack_user_id)
+
+    def events(self):
+        return self._events
+
+class FakeGoogleCalendar(GoogleCalendar):
+    """GoogleCalendar whose services come from a FakeCalendarBackend; parsing and caching are the real code."""
+    def __init__(self, backend, **kwargs):
+        super().__init__('fake-client-id', 'fake-client-secret', 'http://localhost/callback', [], **kwargs)
+        self.backend = backend
+
+    def get_calendar_service(self, refresh_token, client_id, client_secret, token_uri, scopes, timeout=None, cache_key=None, **kwargs):
+        self.backend.counter.incr('calendar.get_service')
+        return self.backend.service_for(cache_key)
+
+class FakeSlackClient:
+    """Records chat_postMessage calls instead of sending them."""
+    def __init__(self, latency=0.0, counter=None):
+        self.latency = latency
+        self.counter = counter or CallCounter()
+        self.posts = []
+        self._lock = threading.Lock()
+
+    def chat_postMessage(self, channel, text, **kwargs):
+        self.counter.incr('slack.chat_postMessage')
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.posts.append((channel, text))
+        return {'ok': True}
+
+class _CountingCursor:
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def execute(self, query, params=None):
+        self._counter.incr('db.queries')
+        return self._cursor.execute(query, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class CountingDatabase(Database):
+    """Database that counts every statement sent to Postgres."""
+    def __init__(self, *args, counter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counter = counter or CallCounter()
+
+    @contextlib.contextmanager
+    def _cursor(self):
+        with super()._cursor() as cur:
+            yield _CountingCursor(cur, self.counter)
@@ -0,0 +1,147 @@
+import datetime
+import hmac
+import logging
+import secrets
+import uuid
+
+logger = logging.getLogger(__name__)
+
+TOKEN_URI = "https://oauth2.googleapis.com/token"
+
+class CalendarWatchManager:
+    """
+    Opens, renews and validates Google Calendar events.watch channels so that
+    calendar changes arrive as push notifications instead of being polled for.
+    """
+    def __init__(self, db, google_calendar, config):
+        self.db = db
+        self.google_calendar = google_calendar
+        self.config = config
+
+    @property
+    def enabled(self):
+        return bool(self.config.GOOGLE_WATCH_ADDRESS)
+
+    def ensure_channels(self, owns=None):
+        """
+        Opens a channel for every authorized user without one that outlives the renewal
+        margin, then stops the channels it replaces, and forgets the channels of users who
+        are no longer authorized. Meant to run periodically. With several scheduler
+        replicas, owns(slack_user_id) limits this to our own users, wherever the channel
+        was opened.
+        """
+        if not self.enabled:
+            return
+        self.drop_orphaned_channels(owns)
+        renew_before = datetime.datetime.utcnow() + datetime.timedelta(hours=self.config.CALENDAR_WATCH_RENEW_BEFORE_HOURS)
+        users = self.db.get_users_needing_watch(renew_before)
+        if owns is not None:
+            users = [u for u in users if owns(u['slack_user_id'])]
+        if users:
+            logger.info(f"Opening Calendar watch channels for {len(users)} users.")
+        for user_data in users:
+            try:
+                self.watch_user(user_data)
+            except Exception as e:
+                logger.error(f"Error opening watch channel for user {user_data['slack_user_id']}: {e}", exc_info=True)
+
+    def drop_orphaned_channels(self, owns=None):
+        """
+        Deletes the channels of users who disconnected, went dormant or were removed. Their
+        refresh token no longer works, so channels().stop can't be called for them; Google
+        expires the channel by itself, and its notifications meanwhile match no channel.
+        """
+        channels = self.db.get_orphaned_watch_channels()
+        if owns is not None:
+            channels = [c for c in channels if owns(c['slack_user_id'])]
+        for channel in channels:
+            self.db.delete_watch_channel(channel['channel_id'])
+        if channels:
+            logger.info(f"Dropped {len(channels)} watch channels of users who are no longer authorized.")
+
+    def watch_user(self, user_data):
+        slack_user_id = user_data['slack_user_id']
+        # Shares the poller's cached credentials, so renewals rarely refresh a token, and
+        # the timeout keeps one stuck call from holding up the renewal job.
+        service = self.google_calendar.get_calendar_service(
+            user_data['google_refresh_token'],
+            self.config.GOOGLE_CLIENT_ID, self.config.GOOGLE_CLIENT_SECRET,
+            TOKEN_URI, self.config.GOOGLE_SCOPES,
+            timeout=self.config.USER_POLL_TIMEOUT_SECONDS, cache_key=slack_user_id,
+            access_token=user_data.get('google_access_token'),
+            token_expiry=user_data.get('google_token_expiry')
+        )
+        if not service:
+            return
+
+        old_channels = self.db.get_watch_channels_for_user(slack_user_id)
+
+        channel_id = str(uuid.uuid4())
+        channel_token = secrets.token_urlsafe(32)
+        channel = service.events().watch(
+            calendarId='primary',
+            body={
+                'id': channel_id,
+                'type': 'web_hook',
+                'address': self.config.GOOGLE_WATCH_ADDRESS,
+                'token': channel_token,
+                'params': {'ttl': str(self.config.CALENDAR_WATCH_TTL_HOURS * 3600)},
+            }
+        ).execute()
+        expiration = datetime.datetime.utcfromtimestamp(int(channel['expiration']) / 1000)
+        self.db.save_watch_channel(channel_id, slack_user_id, channel['resourceId'], channel_token, expiration)
+        logger.info(f"Opened watch channel {channel_id} for {slack_user_id}, expires {expiration}.")
+
+        # Overlapping channels are fine; stop the old ones only once the new one is in place.
+        for old in old_channels:
+            try:
+                service.channels().stop(body={'id': old['channel_id'], 'resourceId': old['resource_id']}).execute()
+            except Exception as e:
+                # Already-expired channels return 404; the row is stale either way.
+                logger.debug(f"Could not stop watch channel {old['channel_id']}: {e}")
+            self.db.delete_watch_channel(old['channel_id'])
+
+    def handle_notification(self, headers):
+        """
+        Validates an incoming push notification and returns the Slack user whose calendar
+        changed, or None if the notification should be ignored.
+        """
+        channel_id = headers.get('X-Goog-Channel-ID')
+        resource_state = headers.get('X-Goog-Resource-State')
+        if not channel_id:
+            return None
+
+        channel = self.db.get_watch_channel(channel_id)
+        if not channel:
+            logger.warning(f"Push notification for unknown channel {channel_id}.")
+            return None
+        if not hmac.compare_digest(channel['channel_token'], headers.get('X-Goog-Channel-Token', '')):
+            logger.warning(f"Push notification for channel {channel_id} had a bad token.")
+            return None
+
+        # 'sync' is the handshake Google sends when the channel is opened; nothing changed yet.
+        if resource_state == 'sync':
+            return None
+
+        return channel['slack_user_id']
+
+def send_fake_notification(url, channel_id, channel_token, resource_state='exists', message_number=1):
+    """Posts a notification shaped like Google's to a running app, for local testing."""
+    import requests
+    return requests.post(url, headers={
+        'X-Goog-Channel-ID': channel_id,
+        'X-Goog-Channel-Token': channel_token,
+        'X-Goog-Resource-ID': 'fake-resource',
+        'X-Goog-Resource-State': resource_state,
+        'X-Goog-Message-Number': str(message_number),
+    }, timeout=10)
+
+if __name__ == '__main__':
+    # Usage: python calendar_push.py <channel_id> <channel_token> [url]
+    import sys
+    if len(sys.argv) < 3:
+        print("Usage: python calendar_push.py <channel_id> <channel_token> [url]")
+    else:
+        target = sys.argv[3] if len(sys.argv) > 3 else "http://localhost:8080/google/calendar/notifications"
+        response = send_fake_notification(target, sys.argv[1], sys.argv[2])
+        print(f"{response.status_code} {response.text}")
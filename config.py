@@ -21,6 +21,8 @@ class Config:
         "openid"
     ]
 
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+
     GLEAN_API_KEY = os.environ.get("GLEAN_API_KEY")
     GLEAN_BASE_URL = "https://api.sofi.com/glean/v1"
 
@@ -28,6 +30,86 @@ class Config:
     DB_NAME = os.environ.get("DB_NAME")
     DB_USER = os.environ.get("DB_USER")
     DB_PASSWORD = os.environ.get("DB_PASSWORD")
+    # Shared by web request threads and scheduler workers; keep the max above POLL_CONCURRENCY.
+    DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", "2"))
+    DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "24"))
+    DB_POOL_TIMEOUT_SECONDS = float(os.environ.get("DB_POOL_TIMEOUT_SECONDS", "5"))
 
     REMINDER_WINDOW_HOURS = 3
-    CALENDAR_CHECK_INTERVAL_MINUTES = 1 # Changed from 15 to 1
\ No newline at end of file
+    CALENDAR_CHECK_INTERVAL_MINUTES = 1 # Changed from 15 to 1
+
+    # Adaptive polling: each user is checked when their next meeting enters the reminder
+    # window, never more often than CALENDAR_CHECK_INTERVAL_MINUTES and, for idle
+    # calendars, at least every POLL_IDLE_MAX_INTERVAL_MINUTES.
+    POLL_IDLE_MAX_INTERVAL_MINUTES = int(os.environ.get("POLL_IDLE_MAX_INTERVAL_MINUTES", "10"))
+    SCHEDULER_TICK_SECONDS = 10
+    USER_RELOAD_INTERVAL_SECONDS = 60
+    # A tick stops starting new polls after this long and defers the remaining due users to the next tick.
+    TICK_BUDGET_SECONDS = float(os.environ.get("TICK_BUDGET_SECONDS", "8"))
+
+    # Calendar polling runs users in parallel on a bounded thread pool.
+    POLL_CONCURRENCY = int(os.environ.get("POLL_CONCURRENCY", "16"))
+    # Per-user deadline: bounds each Google HTTP call and drops a user's results if exceeded.
+    USER_POLL_TIMEOUT_SECONDS = int(os.environ.get("USER_POLL_TIMEOUT_SECONDS", "20"))
+
+    # Fetch only calendar changes using Google sync tokens instead of re-listing the window every tick.
+    CALENDAR_INCREMENTAL_SYNC = os.environ.get("CALENDAR_INCREMENTAL_SYNC", "true").lower() == "true"
+
+    # Up to this many meetings found in the same tick share one prep message; 1 sends one message per meeting.
+    REMINDER_COALESCE_MAX_MEETINGS = int(os.environ.get("REMINDER_COALESCE_MAX_MEETINGS", "1"))
+
+    # Sent-reminder history is kept in daily partitions by meeting start and dropped after this long.
+    SENT_NOTIFICATION_RETENTION_DAYS = 2
+    # Rows per round-trip when streaming authorized users from the server-side cursor.
+    USER_STREAM_BATCH_SIZE = 1000
+
+    # Outbound Slack delivery. chat.postMessage allows about one message per second per channel.
+    SLACK_DELIVERY_WORKERS = int(os.environ.get("SLACK_DELIVERY_WORKERS", "2"))
+    SLACK_CHANNEL_RATE_PER_SECOND = float(os.environ.get("SLACK_CHANNEL_RATE_PER_SECOND", "1"))
+    SLACK_CHANNEL_BURST = int(os.environ.get("SLACK_CHANNEL_BURST", "3"))
+    SLACK_DELIVERY_MAX_RETRIES = int(os.environ.get("SLACK_DELIVERY_MAX_RETRIES", "5"))
+    # On shutdown, queued reminders get this long to go out; the rest are released for the next tick.
+    SLACK_DELIVERY_DRAIN_SECONDS = int(os.environ.get("SLACK_DELIVERY_DRAIN_SECONDS", "10"))
+
+    # Scheduler replicas heartbeat into Postgres and split users between the live ones.
+    WORKER_HEARTBEAT_INTERVAL_SECONDS = 15
+    WORKER_HEARTBEAT_TTL_SECONDS = 60
+
+    # In-memory meeting index: global cap across users (LRU-evicted) and how long a
+    # windowed fetch is reused when incremental sync is off.
+    EVENT_STORE_MAX_EVENTS = int(os.environ.get("EVENT_STORE_MAX_EVENTS", "500000"))
+    EVENT_CACHE_TTL_SECONDS = int(os.environ.get("EVENT_CACHE_TTL_SECONDS", "300"))
+
+    # Public HTTPS URL of the /google/calendar/notifications route. Setting it turns on
+    # Calendar push notifications; polling then drops to a slow safety-net sweep.
+    GOOGLE_WATCH_ADDRESS = os.environ.get("GOOGLE_WATCH_ADDRESS")
+    CALENDAR_WATCH_TTL_HOURS = 24 * 7
+    CALENDAR_WATCH_RENEW_BEFORE_HOURS = 12
+    CALENDAR_WATCH_RENEW_INTERVAL_MINUTES = 30
+    CALENDAR_SAFETY_SWEEP_MINUTES = 15
+
+    # Background access-token refresh. Tokens are refreshed TOKEN_REFRESH_AHEAD_MINUTES before
+    # expiry; failures back off exponentially, and after TOKEN_DORMANT_AFTER_FAILURES failures
+    # ending in invalid_grant the user is dormant (not polled) until they re-authorize.
+    TOKEN_REFRESH_INTERVAL_SECONDS = 60
+    TOKEN_REFRESH_AHEAD_MINUTES = 15
+    TOKEN_REFRESH_BATCH_SIZE = 200
+    TOKEN_REFRESH_CONCURRENCY = int(os.environ.get("TOKEN_REFRESH_CONCURRENCY", "4"))
+    TOKEN_REFRESH_LEASE_SECONDS = 120
+    TOKEN_RETRY_BASE_SECONDS = 60
+    TOKEN_RETRY_MAX_SECONDS = 6 * 3600
+    TOKEN_DORMANT_AFTER_FAILURES = 3
+
+    # How long a published App Home view is trusted before the next open rebuilds it.
+    HOME_VIEW_CACHE_TTL_SECONDS = int(os.environ.get("HOME_VIEW_CACHE_TTL_SECONDS", "300"))
+
+    # Port the scheduler worker serves /metrics on (the web process serves it on its own routes).
+    WORKER_METRICS_PORT = int(os.environ.get("WORKER_METRICS_PORT", "9100"))
+
+    # On-demand sampling profiler: where folded-stack files go, how often stacks are
+    # sampled, and how many runs one SIGUSR1 (worker) arms. ADMIN_TOKEN enables the web
+    # app's POST /admin/profile endpoint; without it the endpoint is off.
+    PROFILE_OUTPUT_DIR = os.environ.get("PROFILE_OUTPUT_DIR", "/tmp/profiles")
+    PROFILE_SAMPLE_INTERVAL_MS = 10
+    PROFILE_DEFAULT_RUNS = 5
+    ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
@@ -1,45 +1,152 @@
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from contextlib import contextmanager
+import datetime
 import logging
+import select
+import threading
+import time
+
+from metrics import DB_QUERY_LATENCY, db_timed
 
 # Get the logger instance
 logger = logging.getLogger(__name__)
 
+# pg_notify channels the web process uses to hand work to scheduler workers.
+USER_CONNECTED_CHANNEL = "user_connected"
+CALENDAR_CHANGED_CHANNEL = "calendar_changed"
+PROFILE_CHANNEL = "profile_workers"
+USER_DORMANT_CHANNEL = "user_dormant"
+# Advisory lock serialising sent_notifications partition DDL across replicas and migrate.py.
+NOTIFICATION_PARTITIONS_LOCK = 0x73656e74
+
+class PoolTimeout(PoolError):
+    """Raised when no pooled connection frees up within the checkout timeout."""
+
 class Database:
     """
     Handles all database operations.
+
+    Connections come from a thread-safe pool so the web request threads and the
+    scheduler's workers can query concurrently. Every method checks a connection
+    out for the duration of one cursor and returns it afterwards.
     """
-    def __init__(self, host, dbname, user, password):
+    def __init__(self, host, dbname, user, password, min_size=1, max_size=10, checkout_timeout=5, health_check_seconds=30, port=None):
         self.conn_params = {
             "host": host,
+            "port": port,
             "dbname": dbname,
             "user": user,
-            "password": password
+            "password": password,
+            "connect_timeout": 10,
+            # TCP keepalives notice dead servers/NAT drops on idle pooled connections.
+            "keepalives": 1,
+            "keepalives_idle": 60,
         }
-        self.conn = None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_seconds = health_check_seconds
+        self.pool = None
+        # ThreadedConnectionPool fails immediately when exhausted; the semaphore makes callers wait instead.
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used = {}
+        self._user_listeners = []
+        # Days known to have a sent_notifications partition, so inserts rarely need to check.
+        self._notification_partition_days = set()
 
     def connect(self):
         """
-        Establishes a connection to the database.
+        Opens the connection pool. The schema is managed separately, see migrate.py.
         """
         try:
-            self.conn = psycopg2.connect(**self.conn_params)
-            self.conn.autocommit = True
-            self.create_tables()
+            self.pool = ThreadedConnectionPool(self.min_size, self.max_size, **self.conn_params)
             print("Database connected successfully.")
         except Exception as e:
             print(f"Error connecting to database: {e}")
-            self.conn = None
+            self.pool = None
+
+    @contextmanager
+    def _cursor(self):
+        """Checks out a healthy connection, yields a cursor on it, and returns it to the pool."""
+        conn = self._checkout()
+        broken = False
+        try:
+            with conn.cursor() as cur:
+                yield cur
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # The connection is likely dead; don't hand it to the next caller.
+            broken = True
+            raise
+        finally:
+            self._checkin(conn, broken)
+
+    def _checkout(self):
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolTimeout(f"No database connection available within {self.checkout_timeout}s")
+        try:
+            conn = self.pool.getconn()
+            if not self._is_healthy(conn):
+                # Closing it makes the pool open a fresh connection on the next getconn().
+                self.pool.putconn(conn, close=True)
+                self._last_used.pop(id(conn), None)
+                conn = self.pool.getconn()
+            if not conn.autocommit:
+                conn.autocommit = True
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, conn, broken=False):
+        try:
+            if broken or conn.closed:
+                self._last_used.pop(id(conn), None)
+                self.pool.putconn(conn, close=True)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self.pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if not conn.autocommit:
+            conn.autocommit = True
+        # Connections used recently are assumed fine; only idle ones pay for a round-trip.
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_seconds:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except psycopg2.Error:
+            return False
+
+    def add_user_listener(self, listener):
+        """Registers listener(slack_user_id), called after this process writes a user's tokens."""
+        self._user_listeners.append(listener)
+
+    def _notify_user_changed(self, slack_user_id):
+        for listener in self._user_listeners:
+            try:
+                listener(slack_user_id)
+            except Exception as e:
+                logger.error(f"Error in user change listener for {slack_user_id}: {e}", exc_info=True)
 
     def create_tables(self):
         """
         Creates the necessary tables if they don't already exist.
         """
-        if not self.conn:
+        if not self.pool:
             print("Database not connected, cannot create tables.")
             return
 
-        with self.conn.cursor() as cur:
+        with self._cursor() as cur:
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS users (
                     slack_user_id VARCHAR(50) PRIMARY KEY,
@@ -51,25 +158,175 @@ class Database:
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
             """)
-            # ADD THIS NEW TABLE TO TRACK SENT REMINDERS
+            # Calendar API sync token for incremental event fetches.
+            cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS google_sync_token TEXT;")
+            # Access token kept fresh by TokenManager (google_token_expiry is its expiry), and
+            # per-user refresh failure state: backoff, and dormancy after repeated invalid_grant.
+            cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS google_access_token TEXT;")
+            cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS token_failure_count INTEGER NOT NULL DEFAULT 0;")
+            cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS token_next_attempt_at TIMESTAMP;")
+            cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS token_dormant_at TIMESTAMP;")
+            # Serves the authorized-user scan (get_all_authorized_users / iter_authorized_users) in key order.
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS users_authorized_idx ON users (slack_user_id)
+                WHERE google_refresh_token IS NOT NULL AND token_dormant_at IS NULL;
+            """)
+            # Sent reminders, range-partitioned by meeting start so old history is dropped a
+            # whole partition at a time (see maintain_notification_partitions) rather than
+            # growing forever. event_id embeds the start, so the key stays unique per partition.
+            # Reminders are deduplicated per Slack channel, so that is what channel_id holds.
+            cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('sent_notifications');")
+            row = cur.fetchone()
+            if row and row[0] != 'p':
+                cur.execute("ALTER TABLE sent_notifications RENAME TO sent_notifications_unpartitioned;")
+            elif row:
+                # Early partitioned tables still called the column slack_user_id.
+                cur.execute("""
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'sent_notifications' AND column_name = 'slack_user_id';
+                """)
+                if cur.fetchone():
+                    cur.execute("ALTER TABLE sent_notifications RENAME COLUMN slack_user_id TO channel_id;")
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS sent_notifications (
-                    slack_user_id VARCHAR(50) NOT NULL,
+                    channel_id VARCHAR(50) NOT NULL,
                     event_id VARCHAR(255) NOT NULL,
+                    meeting_start TIMESTAMP NOT NULL,
                     sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (slack_user_id, event_id)
+                    PRIMARY KEY (channel_id, event_id, meeting_start)
+                ) PARTITION BY RANGE (meeting_start);
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS calendar_watch_channels (
+                    channel_id VARCHAR(64) PRIMARY KEY,
+                    slack_user_id VARCHAR(50) NOT NULL,
+                    resource_id VARCHAR(255) NOT NULL,
+                    channel_token VARCHAR(128) NOT NULL,
+                    expiration TIMESTAMP NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS calendar_watch_channels_user_idx ON calendar_watch_channels (slack_user_id);")
+            # Live scheduler processes; users are partitioned across them.
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS scheduler_workers (
+                    worker_id VARCHAR(128) PRIMARY KEY,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    heartbeat_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
             """)
+        self.maintain_notification_partitions()
+        self._migrate_unpartitioned_notifications()
         print("Tables checked/created.")
 
+    def _migrate_unpartitioned_notifications(self):
+        """
+        Copies still-relevant rows from the pre-partitioning table, then drops it. Only rows
+        keyed "<uid>/<start epoch>" can be placed in a partition; older per-user rows
+        no longer match any reminder key and are discarded. Rows with such keys were written
+        per channel, so their slack_user_id column already holds the channel ID.
+        """
+        with self._cursor() as cur:
+            cur.execute("SELECT to_regclass('sent_notifications_unpartitioned') IS NOT NULL;")
+            if not cur.fetchone()[0]:
+                return
+            cur.execute("""
+                INSERT INTO sent_notifications (channel_id, event_id, meeting_start, sent_at)
+                SELECT slack_user_id, event_id, start, sent_at FROM (
+                    SELECT slack_user_id, event_id, sent_at,
+                           to_timestamp(substring(event_id from '/([0-9]+)$')::bigint) AT TIME ZONE 'UTC' AS start
+                    FROM sent_notifications_unpartitioned
+                    WHERE event_id ~ '/[0-9]+$'
+                ) legacy
+                WHERE start >= (SELECT min(lower_bound) FROM (
+                    SELECT to_timestamp(substring(c.relname from '_p([0-9]{8})$'), 'YYYYMMDD')::timestamp AS lower_bound
+                    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = 'sent_notifications'::regclass
+                ) bounds)
+                AND start < (CURRENT_TIMESTAMP AT TIME ZONE 'UTC') + interval '1 day'
+                ON CONFLICT DO NOTHING;
+            """)
+            migrated = cur.rowcount
+            cur.execute("DROP TABLE sent_notifications_unpartitioned;")
+        print(f"Migrated {migrated} sent notifications into the partitioned table.")
+
+    def maintain_notification_partitions(self, days_ahead=2, retention_days=2):
+        """
+        Creates daily sent_notifications partitions from retention_days ago through
+        days_ahead from now, and drops partitions that ended more than retention_days ago.
+        Idempotent; run at migration time and periodically by the scheduler.
+        """
+        if not self.pool:
+            print("Database not connected.")
+            return
+        today = datetime.datetime.utcnow().date()
+        first_day = today - datetime.timedelta(days=retention_days)
+        created = dropped = 0
+        with self._cursor() as cur, self._partitions_locked(cur):
+            cur.execute("""
+                SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'sent_notifications'::regclass;
+            """)
+            existing = {datetime.datetime.strptime(row[0][-8:], "%Y%m%d").date() for row in cur.fetchall()}
+            present = set(existing)
+            for offset in range(retention_days + days_ahead + 1):
+                day = first_day + datetime.timedelta(days=offset)
+                if day not in existing:
+                    self._create_notification_partition(cur, day)
+                    present.add(day)
+                    created += 1
+            for day in existing:
+                if day < first_day:
+                    cur.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(sql.Identifier(f"sent_notifications_p{day:%Y%m%d}")))
+                    present.discard(day)
+                    dropped += 1
+        self._notification_partition_days = present
+        if created or dropped:
+            logger.info(f"sent_notifications partitions: {created} created, {dropped} dropped.")
+
+    @staticmethod
+    @contextmanager
+    def _partitions_locked(cur):
+        # Concurrent CREATE TABLE ... PARTITION OF for the same day can fail on the catalog's
+        # unique index even with IF NOT EXISTS. Pooled connections autocommit, so this takes
+        # a session lock rather than pg_advisory_xact_lock.
+        cur.execute("SELECT pg_advisory_lock(%s);", (NOTIFICATION_PARTITIONS_LOCK,))
+        try:
+            yield
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s);", (NOTIFICATION_PARTITIONS_LOCK,))
+
+    @staticmethod
+    def _create_notification_partition(cur, day):
+        cur.execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {} PARTITION OF sent_notifications
+            FOR VALUES FROM (%s) TO (%s);
+        """).format(sql.Identifier(f"sent_notifications_p{day:%Y%m%d}")),
+            (day.isoformat(), (day + datetime.timedelta(days=1)).isoformat()))
+
+    def _ensure_notification_partitions(self, days):
+        """
+        Creates partitions for any of days (dates, UTC) not known to have one, so a reminder
+        outside the maintained range (e.g. maintenance hasn't run yet) doesn't fail its batch.
+        """
+        missing = set(days) - self._notification_partition_days
+        if not missing:
+            return
+        with self._cursor() as cur, self._partitions_locked(cur):
+            for day in sorted(missing):
+                self._create_notification_partition(cur, day)
+        self._notification_partition_days |= missing
+        logger.info(f"Created sent_notifications partitions on demand for {sorted(missing)}.")
+
+    @db_timed
     def get_user(self, slack_user_id=None, google_email=None):
         """
         Retrieves a user from the database by Slack user ID or Google email.
         """
-        if not self.conn:
+        if not self.pool:
             print("Database not connected.")
             return None
-        with self.conn.cursor() as cur:
+        with self._cursor() as cur:
             if slack_user_id:
                 cur.execute("SELECT * FROM users WHERE slack_user_id = %s", (slack_user_id,))
             elif google_email:
@@ -82,15 +339,16 @@ class Database:
                 return dict(zip(columns, user_data))
             return None
 
+    @db_timed
     def save_user_tokens(self, slack_user_id, slack_email, google_email, refresh_token, token_expiry):
         """
         Saves or updates a user's Google tokens in the database.
         """
-        if not self.conn:
+        if not self.pool:
             print("Database not connected.")
             return False
         try:
-            with self.conn.cursor() as cur:
+            with self._cursor() as cur:
                 cur.execute("""
                     INSERT INTO users (slack_user_id, slack_email, google_email, google_refresh_token, google_token_expiry)
                     VALUES (%s, %s, %s, %s, %s)
@@ -99,59 +357,385 @@ class Database:
                         google_email = EXCLUDED.google_email,
                         google_refresh_token = EXCLUDED.google_refresh_token,
                         google_token_expiry = EXCLUDED.google_token_expiry,
+                        google_access_token = NULL,
+                        token_failure_count = 0,
+                        token_next_attempt_at = NULL,
+                        token_dormant_at = NULL,
                         updated_at = CURRENT_TIMESTAMP;
                 """, (slack_user_id, slack_email, google_email, refresh_token, token_expiry))
             print(f"User {slack_user_id} tokens saved/updated.")
+            self._notify_user_changed(slack_user_id)
             return True
         except Exception as e:
             print(f"Error saving user tokens: {e}")
             return False
 
+    @db_timed
     def get_all_authorized_users(self):
         """
-        Retrieves all users who have authorized their Google Calendar.
+        Retrieves all users who have authorized their Google Calendar, except dormant ones
+        whose refresh token keeps being rejected.
         """
-        if not self.conn:
+        if not self.pool:
             print("Database not connected.")
             return []
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT slack_user_id, google_email, google_refresh_token FROM users WHERE google_refresh_token IS NOT NULL;")
+        with self._cursor() as cur:
+            cur.execute("""
+                SELECT slack_user_id, google_email, google_refresh_token, google_sync_token,
+                       google_access_token, google_token_expiry, token_next_attempt_at
+                FROM users WHERE google_refresh_token IS NOT NULL AND token_dormant_at IS NULL;
+            """)
             users_data = cur.fetchall()
             columns = [desc[0] for desc in cur.description]
             return [dict(zip(columns, user_data)) for user_data in users_data]
 
-    def record_notification_sent(self, slack_user_id, event_id):
-        """Records that a notification for a specific event has been sent."""
-        if not self.conn: return False
+    @db_timed
+    def claim_tokens_to_refresh(self, expiring_before, now, limit, lease_seconds):
+        """
+        Claims up to `limit` active users whose access token is missing or expires before
+        expiring_before and who aren't backing off. Claimed rows get token_next_attempt_at
+        pushed out by lease_seconds, so concurrent workers (SKIP LOCKED) and the next run
+        leave them alone while they are being refreshed. All times are naive UTC.
+        """
+        if not self.pool: return []
+        with self._cursor() as cur:
+            cur.execute("""
+                UPDATE users SET token_next_attempt_at = %s + make_interval(secs => %s)
+                WHERE slack_user_id IN (
+                    SELECT slack_user_id FROM users
+                    WHERE google_refresh_token IS NOT NULL AND token_dormant_at IS NULL
+                    AND (google_access_token IS NULL OR google_token_expiry IS NULL OR google_token_expiry < %s)
+                    AND (token_next_attempt_at IS NULL OR token_next_attempt_at <= %s)
+                    ORDER BY google_token_expiry NULLS FIRST
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING slack_user_id, google_refresh_token;
+            """, (now, lease_seconds, expiring_before, now, limit))
+            columns = [desc[0] for desc in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    @db_timed
+    def save_access_tokens(self, tokens):
+        """Stores refreshed (slack_user_id, access_token, expiry) rows and clears their failure state."""
+        if not self.pool or not tokens: return
+        with self._cursor() as cur:
+            execute_values(cur, """
+                UPDATE users SET
+                    google_access_token = t.access_token,
+                    google_token_expiry = t.expiry::timestamp,
+                    token_failure_count = 0,
+                    token_next_attempt_at = NULL
+                FROM (VALUES %s) AS t (slack_user_id, access_token, expiry)
+                WHERE users.slack_user_id = t.slack_user_id;
+            """, list(tokens))
+
+    @db_timed
+    def record_token_failure(self, slack_user_id, now, invalid_grant, base_seconds, max_seconds, dormant_after):
+        """
+        Counts a failed refresh and backs the user off exponentially. A user with
+        dormant_after consecutive failures, the latest an invalid_grant (refresh token
+        revoked or expired), is marked dormant until they re-authorize.
+        Returns (failure_count, dormant).
+        """
+        if not self.pool: return (0, False)
+        with self._cursor() as cur:
+            # Right-hand sides see the row's old values, so token_failure_count here is the previous count.
+            cur.execute("""
+                UPDATE users SET
+                    token_failure_count = token_failure_count + 1,
+                    token_next_attempt_at = %(now)s + make_interval(secs => LEAST(%(max)s, %(base)s * power(2, token_failure_count))),
+                    token_dormant_at = CASE
+                        WHEN %(invalid_grant)s AND token_failure_count + 1 >= %(dormant_after)s THEN %(now)s
+                        ELSE token_dormant_at
+                    END
+                WHERE slack_user_id = %(slack_user_id)s
+                RETURNING token_failure_count, token_dormant_at IS NOT NULL;
+            """, {
+                'now': now, 'max': max_seconds, 'base': base_seconds, 'invalid_grant': invalid_grant,
+                'dormant_after': dormant_after, 'slack_user_id': slack_user_id,
+            })
+            row = cur.fetchone()
+            return (row[0], row[1]) if row else (0, False)
+
+    def iter_authorized_users(self, batch_size=1000):
+        """
+        Yields the same rows as get_all_authorized_users, streamed from a server-side cursor
+        batch_size rows at a time, so callers that filter (e.g. to the users this worker
+        owns) never hold every user in memory. Holds one pooled connection until exhausted
+        or closed.
+        """
+        if not self.pool:
+            print("Database not connected.")
+            return
+        conn = self._checkout()
+        broken = False
+        started = time.perf_counter()
+        try:
+            # Named cursors only live inside a transaction.
+            conn.autocommit = False
+            with conn:
+                with conn.cursor(name='authorized_users') as cur:
+                    cur.itersize = batch_size
+                    cur.execute("""
+                        SELECT slack_user_id, google_email, google_refresh_token, google_sync_token,
+                               google_access_token, google_token_expiry, token_next_attempt_at
+                        FROM users WHERE google_refresh_token IS NOT NULL AND token_dormant_at IS NULL
+                        ORDER BY slack_user_id;
+                    """)
+                    columns = None
+                    for row in cur:
+                        if columns is None:
+                            columns = [desc[0] for desc in cur.description]
+                        yield dict(zip(columns, row))
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if not broken and not conn.closed:
+                conn.autocommit = True
+            self._checkin(conn, broken)
+            DB_QUERY_LATENCY.labels('iter_authorized_users').observe(time.perf_counter() - started)
+
+    @db_timed
+    def save_sync_token(self, slack_user_id, sync_token):
+        """Stores the Calendar API nextSyncToken for a user's next incremental fetch."""
+        if not self.pool: return False
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    "UPDATE users SET google_sync_token = %s WHERE slack_user_id = %s",
+                    (sync_token, slack_user_id)
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Error saving sync token: {e}")
+            return False
+
+    @db_timed
+    def get_sent_notifications(self, rows):
+        """
+        Takes (channel_id, event_id, meeting_start) rows and returns the (channel_id,
+        event_id) pairs among them that have already been notified, using a single query
+        regardless of how many rows are passed. The meeting_start range lets Postgres
+        prune the scan to the partitions those meetings fall in.
+        """
+        rows = list(rows)
+        if not rows:
+            return set()
+        if not self.pool: return {row[:2] for row in rows} # Treat everything as sent to prevent duplicates on db error
+        starts = [row[2] for row in rows]
+        with self._cursor() as cur:
+            cur.execute("""
+                SELECT channel_id, event_id FROM sent_notifications
+                WHERE meeting_start BETWEEN %s AND %s
+                AND (channel_id, event_id, meeting_start) IN (
+                    SELECT * FROM unnest(%s::varchar[], %s::varchar[], %s::timestamp[])
+                );
+            """, (min(starts), max(starts), [row[0] for row in rows], [row[1] for row in rows], starts))
+            return set(cur.fetchall())
+
+    @db_timed
+    def record_notifications_sent(self, rows):
+        """
+        Records a batch of (channel_id, event_id, meeting_start) notifications in one
+        multi-row insert. meeting_start (naive UTC) picks the partition, created first if
+        maintenance hasn't made it yet. Returns the
+        (channel_id, event_id) pairs this call actually inserted; a pair missing from the
+        result was already claimed by someone else (e.g. another scheduler replica) and must
+        not be sent.
+        """
+        rows = list(rows)
+        if not rows:
+            return set()
+        if not self.pool: return set()
+        try:
+            self._ensure_notification_partitions({row[2].date() for row in rows})
+            with self._cursor() as cur:
+                inserted = execute_values(cur, """
+                    INSERT INTO sent_notifications (channel_id, event_id, meeting_start)
+                    VALUES %s
+                    ON CONFLICT (channel_id, event_id, meeting_start) DO NOTHING
+                    RETURNING channel_id, event_id;
+                """, rows, page_size=len(rows), fetch=True)
+            return set(inserted)
+        except Exception as e:
+            logger.error(f"Error recording notifications sent: {e}")
+            return set()
+
+    @db_timed
+    def delete_notification_sent(self, channel_id, event_id, meeting_start):
+        """Forgets a sent record, e.g. when the reminder could not be delivered after all."""
+        if not self.pool: return False
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    "DELETE FROM sent_notifications WHERE channel_id = %s AND event_id = %s AND meeting_start = %s",
+                    (channel_id, event_id, meeting_start)
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting sent notification: {e}")
+            return False
+
+    @db_timed
+    def save_watch_channel(self, channel_id, slack_user_id, resource_id, channel_token, expiration):
+        """Records a Calendar events.watch channel opened for a user."""
+        if not self.pool: return False
         try:
-            with self.conn.cursor() as cur:
+            with self._cursor() as cur:
                 cur.execute("""
-                    INSERT INTO sent_notifications (slack_user_id, event_id)
-                    VALUES (%s, %s)
-                    ON CONFLICT (slack_user_id, event_id) DO NOTHING;
-                """, (slack_user_id, event_id))
+                    INSERT INTO calendar_watch_channels (channel_id, slack_user_id, resource_id, channel_token, expiration)
+                    VALUES (%s, %s, %s, %s, %s);
+                """, (channel_id, slack_user_id, resource_id, channel_token, expiration))
             return True
         except Exception as e:
-            logger.error(f"Error recording notification sent: {e}")
+            logger.error(f"Error saving watch channel: {e}")
             return False
 
-    def has_notification_been_sent(self, slack_user_id, event_id):
-        """Checks if a notification for a specific event has already been sent."""
-        if not self.conn: return True # Default to true to prevent duplicates on db error
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT 1 FROM sent_notifications WHERE slack_user_id = %s AND event_id = %s", (slack_user_id, event_id))
-            return cur.fetchone() is not None
+    @db_timed
+    def get_watch_channel(self, channel_id):
+        """Looks up a watch channel by the X-Goog-Channel-ID of an incoming notification."""
+        if not self.pool: return None
+        with self._cursor() as cur:
+            cur.execute("SELECT * FROM calendar_watch_channels WHERE channel_id = %s", (channel_id,))
+            row = cur.fetchone()
+            if row:
+                columns = [desc[0] for desc in cur.description]
+                return dict(zip(columns, row))
+            return None
+
+    @db_timed
+    def get_watch_channels_for_user(self, slack_user_id):
+        if not self.pool: return []
+        with self._cursor() as cur:
+            cur.execute("SELECT * FROM calendar_watch_channels WHERE slack_user_id = %s", (slack_user_id,))
+            columns = [desc[0] for desc in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    @db_timed
+    def get_users_needing_watch(self, renew_before):
+        """Authorized users with no watch channel that stays open past renew_before."""
+        if not self.pool: return []
+        with self._cursor() as cur:
+            cur.execute("""
+                SELECT u.slack_user_id, u.google_refresh_token, u.google_access_token, u.google_token_expiry FROM users u
+                WHERE u.google_refresh_token IS NOT NULL AND u.token_dormant_at IS NULL
+                AND NOT EXISTS (
+                    SELECT 1 FROM calendar_watch_channels c
+                    WHERE c.slack_user_id = u.slack_user_id AND c.expiration > %s
+                );
+            """, (renew_before,))
+            columns = [desc[0] for desc in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    @db_timed
+    def get_orphaned_watch_channels(self):
+        """Watch channels whose user is gone, disconnected or dormant, so nothing should use them."""
+        if not self.pool: return []
+        with self._cursor() as cur:
+            cur.execute("""
+                SELECT c.channel_id, c.slack_user_id, c.resource_id FROM calendar_watch_channels c
+                LEFT JOIN users u ON u.slack_user_id = c.slack_user_id
+                WHERE u.google_refresh_token IS NULL OR u.token_dormant_at IS NOT NULL;
+            """)
+            columns = [desc[0] for desc in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    @db_timed
+    def delete_watch_channel(self, channel_id):
+        if not self.pool: return False
+        try:
+            with self._cursor() as cur:
+                cur.execute("DELETE FROM calendar_watch_channels WHERE channel_id = %s", (channel_id,))
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting watch channel: {e}")
+            return False
+
+    @db_timed
+    def heartbeat_worker(self, worker_id, ttl_seconds):
+        """
+        Upserts this worker's heartbeat, removes workers silent for longer than ttl_seconds,
+        and returns the ids of the remaining live workers. Uses the database clock throughout.
+        """
+        if not self.pool: return [worker_id]
+        with self._cursor() as cur:
+            cur.execute("""
+                INSERT INTO scheduler_workers (worker_id) VALUES (%s)
+                ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = CURRENT_TIMESTAMP;
+            """, (worker_id,))
+            cur.execute(
+                "DELETE FROM scheduler_workers WHERE heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s)",
+                (ttl_seconds,)
+            )
+            cur.execute("SELECT worker_id FROM scheduler_workers;")
+            return [row[0] for row in cur.fetchall()]
+
+    @db_timed
+    def remove_worker(self, worker_id):
+        if not self.pool: return False
+        with self._cursor() as cur:
+            cur.execute("DELETE FROM scheduler_workers WHERE worker_id = %s", (worker_id,))
+        return True
 
     def close(self):
         """
-        Closes the database connection.
+        Closes every pooled connection.
         """
-        if self.conn:
-            self.conn.close()
+        if self.pool:
+            self.pool.closeall()
+            self.pool = None
             print("Database connection closed.")
 
+    @db_timed
+    def notify(self, channel, payload):
+        """Sends a Postgres NOTIFY, delivered to every process LISTENing on channel."""
+        if not self.pool:
+            print("Database not connected.")
+            return
+        with self._cursor() as cur:
+            cur.execute("SELECT pg_notify(%s, %s);", (channel, payload))
+
+    def listen(self, channels, callback, stop_event, poll_seconds=5):
+        """
+        Blocks until stop_event is set, calling callback(channel, payload) for each NOTIFY on
+        channels. Uses its own connection rather than a pooled one, since LISTEN is
+        per-connection state, and reconnects after errors.
+        """
+        while not stop_event.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.conn_params)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    for channel in channels:
+                        cur.execute(sql.SQL("LISTEN {};").format(sql.Identifier(channel)))
+                logger.info(f"Listening for notifications on {', '.join(channels)}.")
+                while not stop_event.is_set():
+                    if select.select([conn], [], [], poll_seconds) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            callback(notify.channel, notify.payload)
+                        except Exception as e:
+                            logger.error(f"Error handling notification on {notify.channel}: {e}", exc_info=True)
+            except psycopg2.Error as e:
+                logger.error(f"Notification listener connection failed: {e}")
+                stop_event.wait(poll_seconds)
+            finally:
+                if conn is not None:
+                    conn.close()
+
 if __name__ == '__main__':
     from config import Config
-    db = Database(Config.DB_HOST, Config.DB_NAME, Config.DB_USER, Config.DB_PASSWORD)
+    db = Database(
+        Config.DB_HOST, Config.DB_NAME, Config.DB_USER, Config.DB_PASSWORD,
+        min_size=Config.DB_POOL_MIN_SIZE, max_size=Config.DB_POOL_MAX_SIZE,
+        checkout_timeout=Config.DB_POOL_TIMEOUT_SECONDS
+    )
     db.connect()
+    db.create_tables()
     db.close()
\ No newline at end of file
@@ -0,0 +1,139 @@
+import bisect
+import collections
+import math
+import threading
+import time
+
+class _UserEvents:
+    __slots__ = ('index', 'meetings', 'window_end', 'fetched_at')
+
+    def __init__(self, window_end, fetched_at):
+        # Sorted (start_ts, event_id) keys for bisect range lookups; meetings holds the values.
+        self.index = []
+        self.meetings = {}
+        self.window_end = window_end
+        self.fetched_at = fetched_at
+
+class EventStore:
+    """
+    In-memory per-user meeting index, ordered by start time. A wide fetch fills it and
+    reminder-window queries are answered locally with a bisect range lookup. The total
+    number of stored meetings is capped; past the cap, least recently used users are evicted.
+    Holds models.Meeting values.
+    """
+    def __init__(self, max_events=500000):
+        self.max_events = max_events
+        self._users = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+
+    def replace(self, slack_user_id, meetings, window_end, fetched_at=None):
+        """Stores the complete set of a user's meetings up to window_end (a timestamp)."""
+        entry = _UserEvents(window_end, fetched_at if fetched_at is not None else time.time())
+        for meeting in meetings:
+            key = (meeting.start_ts, meeting.id)
+            entry.meetings[meeting.id] = meeting
+            entry.index.append(key)
+        entry.index.sort()
+        with self._lock:
+            old = self._users.pop(slack_user_id, None)
+            if old:
+                self._size -= len(old.meetings)
+            self._users[slack_user_id] = entry
+            self._size += len(entry.meetings)
+            self._evict_over_cap()
+
+    def apply_changes(self, slack_user_id, upserts, removed_ids):
+        """Applies an incremental update. Returns False if the user isn't stored."""
+        with self._lock:
+            entry = self._users.get(slack_user_id)
+            if entry is None:
+                return False
+            for event_id in removed_ids:
+                self._remove(entry, event_id)
+            for meeting in upserts:
+                self._remove(entry, meeting.id)
+                entry.meetings[meeting.id] = meeting
+                bisect.insort(entry.index, (meeting.start_ts, meeting.id))
+                self._size += 1
+            self._evict_over_cap()
+            return True
+
+    def trim(self, slack_user_id, before_ts):
+        """Drops a user's meetings that start before before_ts."""
+        with self._lock:
+            entry = self._users.get(slack_user_id)
+            if entry is None:
+                return
+            cut = bisect.bisect_left(entry.index, (before_ts,))
+            for _, event_id in entry.index[:cut]:
+                del entry.meetings[event_id]
+            del entry.index[:cut]
+            self._size -= cut
+
+    def query(self, slack_user_id, start_ts, end_ts, max_age=None):
+        """
+        Returns the user's meetings starting in [start_ts, end_ts], or None on a miss: the
+        user isn't stored, the stored window ends before end_ts, or it's older than max_age seconds.
+        """
+        with self._lock:
+            entry = self._users.get(slack_user_id)
+            if (entry is None or entry.window_end < end_ts
+                    or (max_age is not None and time.time() - entry.fetched_at > max_age)):
+                self._counters['misses'] += 1
+                return None
+            self._users.move_to_end(slack_user_id)
+            self._counters['hits'] += 1
+            lo = bisect.bisect_left(entry.index, (start_ts,))
+            hi = bisect.bisect_left(entry.index, (math.nextafter(end_ts, math.inf),))
+            return [entry.meetings[event_id] for _, event_id in entry.index[lo:hi]]
+
+    def window_end(self, slack_user_id):
+        with self._lock:
+            entry = self._users.get(slack_user_id)
+            return entry.window_end if entry else None
+
+    def invalidate(self, slack_user_id):
+        with self._lock:
+            entry = self._users.pop(slack_user_id, None)
+            if entry:
+                self._size -= len(entry.meetings)
+                self._counters['invalidations'] += 1
+
+    def retain(self, slack_user_ids):
+        """Drops every user not in slack_user_ids."""
+        keep = set(slack_user_ids)
+        with self._lock:
+            for slack_user_id in [u for u in self._users if u not in keep]:
+                self._size -= len(self._users.pop(slack_user_id).meetings)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self._counters['hits'], self._counters['misses']
+            return {
+                'users': len(self._users),
+                'events': self._size,
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+                'evictions': self._counters['evictions'],
+                'invalidations': self._counters['invalidations'],
+            }
+
+    def _remove(self, entry, event_id):
+        meeting = entry.meetings.pop(event_id, None)
+        if meeting is None:
+            return
+        key = (meeting.start_ts, event_id)
+        i = bisect.bisect_left(entry.index, key)
+        if i < len(entry.index) and entry.index[i] == key:
+            del entry.index[i]
+        self._size -= 1
+
+    def _evict_over_cap(self):
+        # Always keep the most recently touched user, even if it alone is over the cap.
+        while self._size > self.max_events and len(self._users) > 1:
+            _, entry = self._users.popitem(last=False)
+            self._size -= len(entry.meetings)
+            self._counters['evictions'] += 1
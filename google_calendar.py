@@ -1,36 +1,93 @@
 import os
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 import datetime
 import pytz
 import logging
 import json
+import threading
+import time
 from google_auth_oauthlib.flow import Flow
+from event_store import EventStore
+from models import Attendee, Meeting, parse_event_time
+from metrics import EVENTS_LIST_LATENCY, TOKEN_REFRESH_LATENCY
 
 logger = logging.getLogger(__name__)
 
+# How far ahead a full sync looks. Incremental syncs keep this window fresh until it no
+# longer covers the reminder window, at which point the next call resyncs from scratch.
+SYNC_WINDOW_HOURS = 72
+
+# Only the event fields the scheduler reads; everything else (descriptions, conference data, ...) is left out.
+EVENT_FIELDS = 'id,iCalUID,summary,status,start,end,attendees(email,displayName,self,responseStatus),creator(self),organizer(self),htmlLink'
+LIST_FIELDS = f'nextPageToken,nextSyncToken,items({EVENT_FIELDS})'
+PAGE_SIZE = 250
+
+# Cached access tokens are refreshed this long before Google's expiry.
+TOKEN_EXPIRY_MARGIN = datetime.timedelta(minutes=5)
+
+_discovery_doc = None
+
+class UserDeadlineExceeded(Exception):
+    """Raised when a single user's poll runs past USER_POLL_TIMEOUT_SECONDS."""
+
+def _calendar_discovery_doc():
+    """The Calendar v3 discovery document bundled with googleapiclient, parsed once per process."""
+    global _discovery_doc
+    if _discovery_doc is None:
+        _discovery_doc = json.loads(get_static_doc('calendar', 'v3'))
+    return _discovery_doc
+
+class _TimeoutRequest(Request):
+    """Token refresh transport with a caller-supplied timeout instead of the 120s default."""
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        return super().__call__(url, method=method, body=body, headers=headers, timeout=timeout or self.timeout, **kwargs)
+
 class GoogleCalendar:
-    def __init__(self, client_id, client_secret, redirect_uri, scopes):
+    def __init__(self, client_id, client_secret, redirect_uri, scopes, event_store_max_events=500000, event_cache_ttl=300):
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
         self.scopes = scopes
+        # Built once; Flow only reads it, so every auth URL and code exchange can share it.
+        self.client_config = {
+            "web": {
+                "client_id": client_id,
+                "client_secret": client_secret,
+                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+                "token_uri": "https://oauth2.googleapis.com/token",
+                "redirect_uris": [redirect_uri]
+            }
+        }
+        # Per-user meeting index backing get_upcoming_meetings and sync_upcoming_meetings.
+        self.event_store = EventStore(max_events=event_store_max_events)
+        self.event_cache_ttl = event_cache_ttl
+        # Per-user credentials and built services, see get_calendar_service.
+        self._service_cache = {}
+        self._service_lock = threading.Lock()
 
-    def get_auth_url(self, slack_user_id):
-        flow = Flow.from_client_config(
-            client_config={
-                "web": {
-                    "client_id": self.client_id,
-                    "client_secret": self.client_secret,
-                    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                    "token_uri": "https://oauth2.googleapis.com/token",
-                    "redirect_uris": [self.redirect_uri]
-                }
-            },
+    def _flow(self):
+        # No PKCE: this is a confidential client, and a random code_challenge would make every
+        # auth URL (and so every unconnected user's home view) different. The verifier also
+        # couldn't reach exchange_code_for_tokens, which runs on a fresh Flow.
+        return Flow.from_client_config(
+            client_config=self.client_config,
             scopes=self.scopes,
-            redirect_uri=self.redirect_uri
+            redirect_uri=self.redirect_uri,
+            autogenerate_code_verifier=False
         )
+
+    def get_auth_url(self, slack_user_id):
+        flow = self._flow()
         authorization_url, state = flow.authorization_url(
             access_type='offline',
             include_granted_scopes='true',
@@ -40,117 +97,294 @@ class GoogleCalendar:
         return authorization_url, state
 
     def exchange_code_for_tokens(self, authorization_response):
-        flow = Flow.from_client_config(
-            client_config={
-                "web": {
-                    "client_id": self.client_id,
-                    "client_secret": self.client_secret,
-                    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                    "token_uri": "https://oauth2.googleapis.com/token",
-                    "redirect_uris": [self.redirect_uri]
-                }
-            },
-            scopes=self.scopes,
-            redirect_uri=self.redirect_uri
-        )
+        flow = self._flow()
         flow.fetch_token(authorization_response=authorization_response)
         credentials = flow.credentials
         return credentials.refresh_token, credentials.token_uri, credentials.client_id, credentials.client_secret, credentials.scopes, credentials.expiry, credentials.id_token
 
-    def get_calendar_service(self, refresh_token, client_id, client_secret, token_uri, scopes):
+    def get_calendar_service(self, refresh_token, client_id, client_secret, token_uri, scopes, timeout=None, cache_key=None,
+                             access_token=None, token_expiry=None, on_refresh_error=None):
+        """
+        Returns an authorized Calendar service. With a cache_key (the Slack user id) the
+        credentials and service are kept and reused until the access token is about to
+        expire, so steady-state calls skip both the token refresh and the service build.
+        Note a cached service keeps the HTTP timeout it was built with.
+
+        access_token/token_expiry (naive UTC) are a token refreshed ahead of time by
+        TokenManager; when fresh it is used instead of refreshing here. on_refresh_error
+        is called with the exception if a refresh here fails.
+        """
+        if cache_key is not None:
+            with self._service_lock:
+                entry = self._service_cache.get(cache_key)
+            if entry and entry['refresh_token'] == refresh_token:
+                creds = entry['creds']
+                if not self._token_fresh(creds) and access_token and access_token != creds.token:
+                    # Adopting it in place also updates the token the cached service sends.
+                    creds.token, creds.expiry = access_token, token_expiry
+                if self._token_fresh(creds):
+                    return entry['service']
+                if self._refresh(creds, timeout, cache_key, on_refresh_error):
+                    return entry['service']
+                return None
+
         creds = Credentials(
-            token=None,
+            token=access_token,
+            expiry=token_expiry,
             refresh_token=refresh_token,
             token_uri=token_uri,
             client_id=client_id,
             client_secret=client_secret,
             scopes=scopes
         )
-        if not creds.valid or creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-                logger.info("Successfully refreshed Google token.")
-            except Exception as e:
-                logger.error(f"Error refreshing Google token: {e}")
+        if not self._token_fresh(creds):
+            if not self._refresh(creds, timeout, cache_key, on_refresh_error):
                 return None
-        return build('calendar', 'v3', credentials=creds)
+        if timeout:
+            # Each service gets its own Http object, so one stuck user can't hold up the others.
+            service = build_from_document(_calendar_discovery_doc(), http=AuthorizedHttp(creds, http=httplib2.Http(timeout=timeout)))
+        else:
+            service = build_from_document(_calendar_discovery_doc(), credentials=creds)
+
+        if cache_key is not None:
+            with self._service_lock:
+                self._service_cache[cache_key] = {'refresh_token': refresh_token, 'creds': creds, 'service': service}
+        return service
 
-    def get_upcoming_meetings(self, service, hours_ahead=3):
+    def evict_user(self, slack_user_id):
+        """Drops everything cached for a user, e.g. after their token was revoked."""
+        with self._service_lock:
+            self._service_cache.pop(slack_user_id, None)
+        self.event_store.invalidate(slack_user_id)
+
+    def retain_users(self, slack_user_ids):
+        """Evicts cached state for every user not in slack_user_ids (i.e. no longer authorized)."""
+        keep = set(slack_user_ids)
+        with self._service_lock:
+            for key in [key for key in self._service_cache if key not in keep]:
+                del self._service_cache[key]
+        self.event_store.retain(keep)
+
+    def refresh_access_token(self, refresh_token, timeout=None):
+        """Exchanges a refresh token for a new access token. Returns (token, expiry); raises on failure."""
+        creds = Credentials(
+            token=None,
+            refresh_token=refresh_token,
+            token_uri="https://oauth2.googleapis.com/token",
+            client_id=self.client_id,
+            client_secret=self.client_secret,
+            scopes=self.scopes
+        )
+        with TOKEN_REFRESH_LATENCY.time():
+            creds.refresh(_TimeoutRequest(timeout) if timeout else Request())
+        return creds.token, creds.expiry
+
+    def _refresh(self, creds, timeout, cache_key, on_refresh_error=None):
+        try:
+            with TOKEN_REFRESH_LATENCY.time():
+                creds.refresh(_TimeoutRequest(timeout) if timeout else Request())
+            logger.info("Successfully refreshed Google token.")
+            return True
+        except Exception as e:
+            if cache_key is not None:
+                self.evict_user(cache_key)
+            if on_refresh_error is not None:
+                on_refresh_error(e)
+            else:
+                logger.error(f"Error refreshing Google token: {e}")
+            return False
+
+    @staticmethod
+    def _token_fresh(creds):
+        if not creds.token or not creds.expiry:
+            return False
+        return creds.expiry - TOKEN_EXPIRY_MARGIN > datetime.datetime.utcnow()
+
+    def get_upcoming_meetings(self, service, hours_ahead=3, slack_user_id=None, deadline=None):
+        """
+        Returns meetings starting within hours_ahead. With a slack_user_id the wider
+        12-hour fetch is kept in the event store and reused for up to event_cache_ttl
+        seconds, so most calls are answered without touching the API. See iter_events
+        for deadline.
+        """
         now_utc = datetime.datetime.utcnow().replace(tzinfo=pytz.utc)
+        window_end_utc = now_utc + datetime.timedelta(hours=hours_ahead)
+
+        if slack_user_id is not None:
+            cached = self.event_store.query(
+                slack_user_id, now_utc.timestamp(), window_end_utc.timestamp(), max_age=self.event_cache_ttl
+            )
+            if cached is not None:
+                return cached
         
         # We will now query for a larger window to avoid timezone issues
-        time_max_dt_utc = now_utc + datetime.timedelta(hours=12) 
+        time_max_dt_utc = now_utc + datetime.timedelta(hours=max(12, hours_ahead))
 
         time_min_query = now_utc.isoformat()
         time_max_query = time_max_dt_utc.isoformat()
 
         logger.info(f"Querying Google Calendar in a 12-hour window from {time_min_query} to {time_max_query}")
 
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=time_min_query,
-            timeMax=time_max_query, # Using the larger 12-hour window for the query
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        events = events_result.get('items', [])
-
-        logger.info(f"Received {len(events)} raw events from Google Calendar.")
-
-        meetings = []
-        for event in events:
-            event_summary = event.get('summary', 'No Summary')
-            event_status = event.get('status')
-
-            if event_status == 'cancelled':
-                continue
-            
-            event_start_dt_utc = None
-            if 'dateTime' in event['start']:
-                try:
-                    dt_obj = datetime.datetime.fromisoformat(event['start']['dateTime'])
-                    event_start_dt_utc = dt_obj.astimezone(pytz.utc)
-                except ValueError:
-                    continue
-            elif 'date' in event['start']:
-                try:
-                    event_start_dt_utc = datetime.datetime.strptime(event['start']['date'], '%Y-%m-%d').replace(tzinfo=pytz.utc)
-                except ValueError:
-                    continue
-            
-            if not event_start_dt_utc:
-                continue
-
-            # This logic filters the results to only include meetings in the original 3-hour window
-            # This ensures we don't send reminders for meetings that are too far away.
-            if event_start_dt_utc < now_utc or event_start_dt_utc > (now_utc + datetime.timedelta(hours=hours_ahead)):
-                continue
-
-            user_is_attendee = False
-            attendees = event.get('attendees', [])
-            is_creator_or_organizer = (event.get('creator', {}).get('self') or event.get('organizer', {}).get('self'))
-
-            if not attendees and is_creator_or_organizer:
-                user_is_attendee = True
-            elif attendees:
-                for attendee in attendees:
-                    if attendee.get('self') and attendee.get('responseStatus') in ['accepted', 'tentative', 'needsAction']:
-                        user_is_attendee = True
-                        break
-            
-            if user_is_attendee:
-                 meetings.append({
-                    'id': event['id'],
-                    'summary': event_summary,
-                    'start': event['start'].get('dateTime', event['start'].get('date')),
-                    'end': event['end'].get('dateTime', event['end'].get('date')),
-                    'attendees': [{'email': a.get('email'), 'display_name': a.get('displayName')} for a in attendees if a.get('email')],
-                    'html_link': event.get('htmlLink')
-                })
+        # Pages are parsed as they arrive, so raw responses never pile up in memory.
+        parsed = list(self.iter_meetings(service, deadline=deadline, timeMin=time_min_query, timeMax=time_max_query))
+
+        if slack_user_id is not None:
+            self.event_store.replace(slack_user_id, parsed, time_max_dt_utc.timestamp())
+        meetings = [m for m in parsed if self._in_window(m, now_utc, hours_ahead)]
+        meetings.sort()
         
         logger.info(f"Finished processing. Found {len(meetings)} valid meetings to return.")
         return meetings
 
+    def sync_upcoming_meetings(self, service, slack_user_id, sync_token, hours_ahead=3, deadline=None):
+        """
+        Incremental variant of get_upcoming_meetings. Keeps the user's events in the event
+        store and only asks Google for what changed since sync_token. Returns
+        (meetings, next_sync_token); the caller is responsible for persisting the token.
+        A sync cut short by the deadline leaves the store and the token untouched.
+        """
+        now_utc = datetime.datetime.utcnow().replace(tzinfo=pytz.utc)
+        now_ts = now_utc.timestamp()
+        end_ts = (now_utc + datetime.timedelta(hours=hours_ahead)).timestamp()
+        window_end = self.event_store.window_end(slack_user_id)
+
+        # A token is only usable alongside the events it was issued for, so a cold store
+        # (e.g. after a restart or eviction) or a window that no longer covers hours_ahead means a full sync.
+        needs_full_sync = not sync_token or window_end is None or window_end < end_ts
+
+        if not needs_full_sync:
+            page_state = {}
+            upserts, removed = [], []
+            try:
+                for event in self.iter_events(service, page_state, deadline=deadline, syncToken=sync_token):
+                    # Cancelled or no-longer-attended events come back as changes too; drop them.
+                    removed.append(event['id'])
+                    meeting = self._parse_meeting(event)
+                    if meeting:
+                        upserts.append(meeting)
+            except HttpError as e:
+                if e.resp.status != 410:
+                    raise
+                logger.info(f"Sync token for {slack_user_id} expired (410 Gone), doing a full resync.")
+                needs_full_sync = True
+            else:
+                next_sync_token = page_state.get('next_sync_token')
+                if self.event_store.apply_changes(slack_user_id, upserts, removed):
+                    self.event_store.trim(slack_user_id, now_ts)
+                    logger.info(f"Applied {len(removed)} calendar changes for {slack_user_id}.")
+                else:
+                    needs_full_sync = True
+
+        if needs_full_sync:
+            window_end_utc = now_utc + datetime.timedelta(hours=max(SYNC_WINDOW_HOURS, hours_ahead))
+            page_state = {}
+            meetings = list(self.iter_meetings(
+                service, page_state, deadline=deadline, timeMin=now_utc.isoformat(), timeMax=window_end_utc.isoformat()
+            ))
+            next_sync_token = page_state.get('next_sync_token')
+            self.event_store.replace(slack_user_id, meetings, window_end_utc.timestamp())
+            logger.info(f"Full calendar sync for {slack_user_id}: {page_state['events']} events, {len(meetings)} meetings.")
+
+        meetings = self.event_store.query(slack_user_id, now_ts, end_ts)
+        # Only possible if the store evicted this user straight away (a single user over the cap).
+        if meetings is None:
+            meetings = []
+        return meetings, next_sync_token
+
+    def invalidate_events(self, slack_user_id):
+        """Forgets a user's stored events, e.g. after a change notification."""
+        self.event_store.invalidate(slack_user_id)
+
+    def iter_events(self, service, page_state=None, deadline=None, **params):
+        """
+        Yields raw events from every page of events().list, asking only for EVENT_FIELDS.
+        If page_state is given it receives the event count and, after the last page,
+        Google's nextSyncToken. HTTP timeouts only bound each request, so with a deadline
+        (a time.monotonic() value) no page is requested once it has passed; raises
+        UserDeadlineExceeded instead.
+        """
+        page_token = None
+        count = 0
+        while True:
+            if deadline is not None and time.monotonic() > deadline:
+                raise UserDeadlineExceeded(f"deadline passed after {count} events")
+            with EVENTS_LIST_LATENCY.time():
+                result = service.events().list(
+                    calendarId='primary',
+                    singleEvents=True,
+                    maxResults=PAGE_SIZE,
+                    fields=LIST_FIELDS,
+                    pageToken=page_token,
+                    **params
+                ).execute()
+            items = result.get('items', [])
+            count += len(items)
+            yield from items
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+        logger.info(f"Received {count} raw events from Google Calendar.")
+        if page_state is not None:
+            page_state['events'] = count
+            page_state['next_sync_token'] = result.get('nextSyncToken')
+
+    def iter_meetings(self, service, page_state=None, deadline=None, **params):
+        """Like iter_events, but yields parsed meetings and skips events the user isn't attending."""
+        for event in self.iter_events(service, page_state, deadline=deadline, **params):
+            meeting = self._parse_meeting(event)
+            if meeting:
+                yield meeting
+
+    @staticmethod
+    def _in_window(meeting, now_utc, hours_ahead):
+        # This logic filters the results to only include meetings in the original 3-hour window
+        # This ensures we don't send reminders for meetings that are too far away.
+        now_ts = now_utc.timestamp()
+        return now_ts <= meeting.start_ts <= now_ts + hours_ahead * 3600
+
+    @staticmethod
+    def _parse_meeting(event):
+        """Turns a raw Calendar event into a Meeting, or None if it isn't one the user is attending."""
+        if event.get('status') == 'cancelled':
+            return None
+
+        start = event['start']
+        try:
+            start_ts = parse_event_time(start.get('dateTime') or start['date'])
+        except (KeyError, ValueError):
+            return None
+
+        user_is_attendee = False
+        attendees = event.get('attendees', [])
+        is_creator_or_organizer = (event.get('creator', {}).get('self') or event.get('organizer', {}).get('self'))
+
+        if not attendees and is_creator_or_organizer:
+            user_is_attendee = True
+        elif attendees:
+            for attendee in attendees:
+                if attendee.get('self') and attendee.get('responseStatus') in ['accepted', 'tentative', 'needsAction']:
+                    user_is_attendee = True
+                    break
+
+        if not user_is_attendee:
+            return None
+
+        end = event.get('end', {})
+        try:
+            end_ts = parse_event_time(end.get('dateTime') or end['date'])
+        except (KeyError, ValueError):
+            end_ts = start_ts
+
+        return Meeting(
+            start_ts=start_ts,
+            end_ts=end_ts,
+            id=event['id'],
+            summary=event.get('summary', 'No Summary'),
+            attendees=tuple(Attendee.from_event(a) for a in attendees if a.get('email')),
+            html_link=event.get('htmlLink'),
+            ical_uid=event.get('iCalUID')
+        )
+
 if __name__ == '__main__':
     from config import Config
     TEST_REFRESH_TOKEN = "YOUR_TEST_REFRESH_TOKEN_HERE"
@@ -161,6 +395,6 @@ if __name__ == '__main__':
             meetings = gc.get_upcoming_meetings(service, hours_ahead=24)
             print(f"Found {len(meetings)} upcoming meetings:")
             for meeting in meetings:
-                print(f"- {meeting['summary']} at {meeting['start']}")
+                print(f"- {meeting.summary} at {meeting.start_dt.isoformat()}")
     else:
         print("Please provide a TEST_REFRESH_TOKEN in google_calendar.py for local testing.")
\ No newline at end of file
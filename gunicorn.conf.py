@@ -0,0 +1,23 @@
+"""
+gunicorn settings for the web image, read from the working directory on start.
+
+Each gunicorn worker keeps its own metrics, so they go through prometheus_client's
+multiprocess mode: every worker writes its values to files in PROMETHEUS_MULTIPROC_DIR
+and /metrics sums them (see metrics.render), whichever worker answers the scrape.
+"""
+import os
+import shutil
+
+# Set before prometheus_client is imported here or in the workers forked from this process.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus-multiproc")
+
+from prometheus_client import multiprocess
+
+def on_starting(server):
+    # Files left by a previous run would otherwise be added into this one's counters.
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
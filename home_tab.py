@@ -0,0 +1,92 @@
+import collections
+import threading
+import time
+
+def build_home_view(auth_url=None):
+    """
+    Builds the App Home view. Pass the Google consent URL for users who haven't connected
+    their calendar yet, or None for connected users. Shared by the Flask and async apps.
+    """
+    if not auth_url:
+        blocks = [{
+            "type": "section",
+            "text": { "type": "mrkdwn", "text": "Welcome back! Your Google Calendar is connected."}
+        }]
+    else:
+        blocks = [
+            {
+                "type": "section",
+                "text": { "type": "mrkdwn", "text": "👋 Hey there! To get started, I need access to your Google Calendar."}
+            },
+            {
+                "type": "actions",
+                "elements": [
+                    {
+                        "type": "button",
+                        "text": { "type": "plain_text", "text": "Connect Google Calendar"},
+                        "style": "primary",
+                        "url": auth_url,
+                        "action_id": "connect_google_calendar"
+                    }
+                ]
+            },
+        ]
+    return {
+        "type": "home",
+        "blocks": blocks
+    }
+
+def is_connected(user_data):
+    """True if the user has a refresh token that hasn't been given up on as dormant."""
+    return bool(user_data and user_data.get('google_refresh_token') and not user_data.get('token_dormant_at'))
+
+class HomeViewCache:
+    """
+    Remembers the home view last published to each user. While an entry is fresh the
+    next app_home_opened needs no DB query and no views.publish at all. invalidate()
+    (e.g. when the user's tokens change) forces a rebuild, but the old view is kept so
+    an identical rebuild still skips the publish. Entries older than ttl_seconds are
+    republished regardless, in case another process published something else since.
+    """
+    def __init__(self, ttl_seconds=300, max_users=50000):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        # slack_user_id -> [view, published_at, valid], least recently published first.
+        self._entries = collections.OrderedDict()
+
+    def _live_entry(self, slack_user_id, now):
+        entry = self._entries.get(slack_user_id)
+        if entry and now - entry[1] < self.ttl_seconds:
+            return entry
+        return None
+
+    def get(self, slack_user_id):
+        """Returns the published view if it is fresh and still valid, else None."""
+        with self._lock:
+            entry = self._live_entry(slack_user_id, time.monotonic())
+            return entry[0] if entry and entry[2] else None
+
+    def unchanged(self, slack_user_id, view):
+        """True if view is what was last published to the user, within the TTL."""
+        with self._lock:
+            entry = self._live_entry(slack_user_id, time.monotonic())
+            return entry is not None and entry[0] == view
+
+    def put(self, slack_user_id, view):
+        """Records view as what the user now sees, and marks it valid again."""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._live_entry(slack_user_id, now)
+            # A skipped publish of the same view doesn't restart the TTL.
+            published_at = entry[1] if entry and entry[0] == view else now
+            self._entries.pop(slack_user_id, None)
+            self._entries[slack_user_id] = [view, published_at, True]
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, slack_user_id):
+        with self._lock:
+            entry = self._entries.get(slack_user_id)
+            if entry:
+                entry[2] = False
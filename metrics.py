@@ -0,0 +1,70 @@
+import functools
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+
+# Prometheus metrics for the reminder pipeline. Observing a histogram or bumping a counter
+# is a lock and a few additions, cheap enough to leave on around every network call.
+
+# Network-call buckets: token refreshes, Calendar list calls and Slack posts sit in the 50ms-5s range.
+_CALL_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+
+TICK_DURATION = Histogram(
+    'reminder_tick_duration_seconds', 'Wall-clock time of scheduler ticks that polled at least one user',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+TOKEN_REFRESH_LATENCY = Histogram(
+    'google_token_refresh_seconds', 'Latency of Google OAuth access token refreshes', buckets=_CALL_BUCKETS
+)
+EVENTS_LIST_LATENCY = Histogram(
+    'google_events_list_seconds', 'Latency of one Calendar events().list page', buckets=_CALL_BUCKETS
+)
+SLACK_POST_LATENCY = Histogram(
+    'slack_post_message_seconds', 'Latency of chat.postMessage calls', buckets=_CALL_BUCKETS
+)
+DB_QUERY_LATENCY = Histogram(
+    'db_query_seconds', 'Latency of Database methods, including pool checkout', ['method'], buckets=_DB_BUCKETS
+)
+
+MEETINGS_FOUND = Counter('meetings_found_total', 'Meetings found inside the reminder window')
+REMINDERS_POSTED = Counter('reminders_posted_total', 'Prep requests successfully posted to Slack')
+DEDUP_HITS = Counter('reminder_dedup_hits_total', 'Reminders skipped because they were already sent or claimed')
+USER_POLL_FAILURES = Counter('user_poll_failures_total', 'Per-user calendar polls that raised')
+
+USERS_DEFERRED = Counter('scheduler_users_deferred_total', 'Due users pushed to the next tick because the tick budget ran out')
+REMINDER_LATENESS = Histogram(
+    'reminder_lateness_seconds', 'How long after a meeting entered the reminder window its reminder was queued',
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+)
+
+SLACK_QUEUE_DEPTH = Gauge('slack_delivery_queue_depth', 'Messages waiting in the Slack delivery queue')
+EVENT_STORE_EVENTS = Gauge('event_store_events', 'Meetings held in the in-memory event store')
+
+def timed(histogram):
+    """Decorator recording each call's duration in histogram, whether it returns or raises."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def db_timed(fn):
+    """timed() for Database methods, labelled with the method name."""
+    return timed(DB_QUERY_LATENCY.labels(fn.__name__))(fn)
+
+def render():
+    """Returns (body, content_type) for a /metrics response."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Under a multi-process server each worker writes its own files; aggregate them per scrape.
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
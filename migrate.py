@@ -0,0 +1,27 @@
+"""
+Creates or updates the database schema. Run once per deploy, before starting the web
+and worker processes:
+
+    python migrate.py
+"""
+import logging
+import sys
+
+from config import Config
+from database import Database
+
+logging.basicConfig(level=Config.LOG_LEVEL)
+
+def main():
+    db = Database(Config.DB_HOST, Config.DB_NAME, Config.DB_USER, Config.DB_PASSWORD, min_size=1, max_size=1)
+    db.connect()
+    if not db.pool:
+        return 1
+    try:
+        db.create_tables()
+    finally:
+        db.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
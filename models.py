@@ -0,0 +1,64 @@
+import calendar
+import datetime
+import functools
+import hashlib
+import sys
+from collections import namedtuple
+
+class Attendee(namedtuple('Attendee', 'email display_name')):
+    """One meeting attendee. Emails are interned, since the same people show up across many meetings."""
+    __slots__ = ()
+
+    @classmethod
+    def from_event(cls, attendee):
+        return cls(sys.intern(attendee['email']), attendee.get('displayName'))
+
+class Meeting(namedtuple('Meeting', 'start_ts end_ts id summary attendees html_link ical_uid')):
+    """
+    Immutable meeting parsed from a Calendar event. start_ts/end_ts are epoch seconds (UTC);
+    start_ts comes first so meetings order by start time. attendees is a tuple of Attendee.
+    ical_uid is shared by every attendee's copy of the event (and by all its recurrences).
+    """
+    __slots__ = ()
+
+    def __hash__(self):
+        # Equal meetings always share id and start, so hashing just those stays consistent with __eq__.
+        return hash((self.id, self.start_ts))
+
+    @property
+    def start_dt(self):
+        return datetime.datetime.fromtimestamp(self.start_ts, datetime.timezone.utc)
+
+    @property
+    def attendee_emails(self):
+        return [a.email for a in self.attendees]
+
+    @property
+    def key(self):
+        """
+        Identifies this occurrence across calendars: every attendee's copy has its own event
+        id but the same iCalUID, and a recurring series' instances differ by start time.
+        """
+        key = f"{self.ical_uid or self.id}/{self.start_ts}"
+        if len(key) > 255:
+            # sent_notifications.event_id is VARCHAR(255); iCalUIDs from other systems can be long.
+            key = hashlib.sha1(key.encode()).hexdigest()
+        return key
+
+@functools.lru_cache(maxsize=16384)
+def parse_event_time(value):
+    """
+    Converts a Calendar 'dateTime' (RFC 3339, e.g. 2025-07-15T10:00:00-07:00 or ...Z) or
+    all-day 'date' (midnight UTC) to epoch seconds. Start/end strings repeat heavily (shared
+    meetings, on-the-hour slots), so results are memoised and most calls are a dict lookup
+    instead of fromisoformat + astimezone. Raises ValueError if malformed.
+    """
+    if len(value) == 10:
+        return calendar.timegm((int(value[0:4]), int(value[5:7]), int(value[8:10]), 0, 0, 0))
+    if value[-1] in 'Zz':
+        # fromisoformat only understands 'Z' from Python 3.11 on.
+        value = value[:-1] + '+00:00'
+    dt = datetime.datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        raise ValueError(f"Event time has no UTC offset: {value!r}")
+    return int(dt.timestamp())
@@ -0,0 +1,72 @@
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+def default_worker_id():
+    return os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+class HashRing:
+    """Consistent hash ring with virtual nodes, so a membership change only moves ~1/N of users."""
+    def __init__(self, members, vnodes=64):
+        self.members = frozenset(members)
+        points = sorted((_hash(f"{member}#{i}"), member) for member in self.members for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [m for _, m in points]
+
+    def owner(self, key):
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+class WorkerMembership:
+    """
+    Registers this scheduler process in Postgres and decides which users it owns.
+    Every live worker (one that heartbeated within the TTL) gets a share of the ring;
+    workers that stop heartbeating are removed and their users move to the survivors.
+    """
+    def __init__(self, db, worker_id=None, heartbeat_ttl_seconds=60, vnodes=64):
+        self.db = db
+        self.worker_id = worker_id or default_worker_id()
+        self.heartbeat_ttl_seconds = heartbeat_ttl_seconds
+        self.vnodes = vnodes
+        self._lock = threading.Lock()
+        # Until the first heartbeat, act as the only worker rather than owning nothing.
+        self._ring = HashRing([self.worker_id], vnodes)
+
+    def heartbeat(self):
+        """Refreshes this worker's registration and rebuilds the ring if membership changed."""
+        try:
+            live = self.db.heartbeat_worker(self.worker_id, self.heartbeat_ttl_seconds)
+        except Exception as e:
+            # Keep the last known ring; peers will drop us if this persists past the TTL.
+            logger.error(f"Worker heartbeat failed for {self.worker_id}: {e}")
+            return
+        if self.worker_id not in live:
+            live.append(self.worker_id)
+        with self._lock:
+            if frozenset(live) == self._ring.members:
+                return
+            self._ring = HashRing(live, self.vnodes)
+        logger.info(f"Scheduler membership changed: {len(live)} live workers {sorted(live)}.")
+
+    def owns(self, slack_user_id):
+        with self._lock:
+            ring = self._ring
+        return ring.owner(slack_user_id) == self.worker_id
+
+    def leave(self):
+        """Deregisters so the remaining workers pick up this worker's users right away."""
+        try:
+            self.db.remove_worker(self.worker_id)
+        except Exception as e:
+            logger.error(f"Error deregistering worker {self.worker_id}: {e}")
@@ -0,0 +1,69 @@
+import heapq
+import random
+import threading
+
+class PollQueue:
+    """
+    Min-heap of users keyed on when their calendar is next due for a check (epoch seconds).
+    Rescheduling pushes a new entry and leaves the old one behind; stale entries are
+    skipped when popped, which keeps every operation O(log n).
+    """
+    def __init__(self):
+        self._heap = []
+        self._due = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._due)
+
+    def __contains__(self, slack_user_id):
+        with self._lock:
+            return slack_user_id in self._due
+
+    def schedule(self, slack_user_id, due_at):
+        with self._lock:
+            self._due[slack_user_id] = due_at
+            heapq.heappush(self._heap, (due_at, slack_user_id))
+
+    def remove(self, slack_user_id):
+        with self._lock:
+            self._due.pop(slack_user_id, None)
+
+    def sync_members(self, slack_user_ids, now, spread_seconds):
+        """
+        Makes the queue hold exactly slack_user_ids. Newcomers get a random first check
+        within spread_seconds so a batch of new users doesn't all fire at once.
+        """
+        members = set(slack_user_ids)
+        with self._lock:
+            for slack_user_id in list(self._due):
+                if slack_user_id not in members:
+                    del self._due[slack_user_id]
+            for slack_user_id in members:
+                if slack_user_id not in self._due:
+                    due_at = now + random.uniform(0, spread_seconds)
+                    self._due[slack_user_id] = due_at
+                    heapq.heappush(self._heap, (due_at, slack_user_id))
+            # Lazy deletion can let the heap outgrow the membership; compact when it does.
+            if len(self._heap) > 2 * len(self._due) + 64:
+                self._heap = [(due_at, user) for user, due_at in self._due.items()]
+                heapq.heapify(self._heap)
+
+    def pop_due(self, now, limit=None):
+        """Removes and returns users due at or before now, earliest first, as (due_at, slack_user_id)."""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and (limit is None or len(due) < limit):
+                due_at, slack_user_id = heapq.heappop(self._heap)
+                if self._due.get(slack_user_id) != due_at:
+                    continue
+                del self._due[slack_user_id]
+                due.append((due_at, slack_user_id))
+        return due
+
+    def next_due(self):
+        with self._lock:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
@@ -0,0 +1,133 @@
+"""
+On-demand sampling profiler. Arm it for the next N scheduler ticks or web requests (via
+SIGUSR1 on the worker or POST /admin/profile on the web app); each armed run samples the
+stacks of every thread in the process and writes them aggregated in folded format, one
+"frame;frame;frame count" line per unique stack, ready for flamegraph.pl or speedscope.
+
+Sampling every thread is what catches work the run hands to pools (calendar polls, DB
+queries, Slack posts), at the price of also catching whatever else the process was doing.
+Nothing runs while the profiler is not armed.
+"""
+import collections
+import contextlib
+import itertools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAX_STACK_DEPTH = 128
+
+def _folded_stack(thread_name, frame):
+    # Pool threads are numbered (calendar-poll_3, slack-delivery-1); merge each pool into one root.
+    thread_name = re.sub(r'[-_]\d+$', '', thread_name)
+    frames = []
+    while frame is not None and len(frames) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.append(thread_name)
+    frames.reverse()
+    return ";".join(frames)
+
+class _Sampler:
+    """Samples all threads' stacks every `interval` seconds on a daemon thread until stopped."""
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.monotonic() - self.started_at
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self.stacks[_folded_stack(names.get(thread_id, f"thread-{thread_id}"), frame)] += 1
+            self.samples += 1
+
+class Profiler:
+    """
+    Profiles the next `count` runs passed to begin()/end() (or session()), one run at a
+    time; runs that start while another is being profiled are not profiled.
+    """
+    def __init__(self, output_dir, interval=0.01):
+        self.output_dir = output_dir
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._active = None
+        self._seq = itertools.count()
+
+    @property
+    def armed(self):
+        return self._remaining > 0
+
+    def arm(self, count):
+        """Profiles the next `count` runs, replacing any count left from an earlier arm()."""
+        with self._lock:
+            self._remaining = max(0, int(count))
+        logger.info(f"Profiler armed for the next {count} runs; output goes to {self.output_dir}.")
+
+    def begin(self, label):
+        """Starts profiling a run if armed and idle. Returns a handle for end(), or None."""
+        if not self._remaining:
+            return None
+        with self._lock:
+            if not self._remaining or self._active is not None:
+                return None
+            self._remaining -= 1
+            sampler = self._active = _Sampler(self.interval)
+        sampler.start()
+        return (label, sampler)
+
+    def end(self, handle):
+        """Stops the run started by begin() and writes its folded stacks. Accepts None."""
+        if handle is None:
+            return None
+        label, sampler = handle
+        sampler.stop()
+        with self._lock:
+            self._active = None
+        try:
+            return self._write(label, sampler)
+        except OSError as e:
+            logger.error(f"Could not write profile for {label}: {e}")
+            return None
+
+    @contextlib.contextmanager
+    def session(self, label):
+        handle = self.begin(label)
+        try:
+            yield
+        finally:
+            self.end(handle)
+
+    def _write(self, label, sampler):
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_label = "".join(c if c.isalnum() or c in "-_" else "_" for c in label)
+        path = os.path.join(
+            self.output_dir,
+            f"{safe_label}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(self._seq)}.folded"
+        )
+        with open(path, "w") as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Wrote profile of {label} ({sampler.samples} samples over {sampler.duration:.2f}s) to {path}")
+        return path
@@ -1,6 +1,23 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from googleapiclient.errors import HttpError
+from google_calendar import UserDeadlineExceeded
+from slack_delivery import SlackDeliveryQueue
+from metrics import (
+    DEDUP_HITS, EVENT_STORE_EVENTS, MEETINGS_FOUND, REMINDER_LATENESS, SLACK_QUEUE_DEPTH, TICK_DURATION,
+    USER_POLL_FAILURES, USERS_DEFERRED,
+)
+from partitioning import WorkerMembership
+from poll_queue import PollQueue
+from profiler import Profiler
+from token_manager import TokenManager
+import collections
 import datetime
+import functools
+import random
+import threading
+import time
 import pytz
 import logging
 
@@ -11,64 +28,425 @@ SLACK_CHANNEL_ID = "C093W3B7F9T"
 GLEAN_BOT_ID = "U07QQTYK2QJ"
 
 class MeetingScheduler:
-    def __init__(self, db, google_calendar_service, slack_client, config):
+    def __init__(self, db, google_calendar_service, slack_client, config, watch_manager=None, profiler=None):
         self.db = db
         self.google_calendar = google_calendar_service
         self.slack_client = slack_client
         self.config = config
+        self.watch_manager = watch_manager
+        self.channel_id = SLACK_CHANNEL_ID
+        # Armed from outside (e.g. SIGUSR1 in worker.py) to sample the next few ticks.
+        self.profiler = profiler or Profiler(config.PROFILE_OUTPUT_DIR, interval=config.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+        # Splits users across every scheduler replica registered in Postgres.
+        self.membership = WorkerMembership(db, heartbeat_ttl_seconds=config.WORKER_HEARTBEAT_TTL_SECONDS)
+        # Reminders are handed to this queue so slow or rate-limited Slack calls never stall polling.
+        self.delivery = SlackDeliveryQueue(
+            slack_client,
+            workers=config.SLACK_DELIVERY_WORKERS,
+            rate_per_second=config.SLACK_CHANNEL_RATE_PER_SECOND,
+            burst=config.SLACK_CHANNEL_BURST,
+            max_retries=config.SLACK_DELIVERY_MAX_RETRIES
+        )
+        # Keeps access tokens fresh in the background so polls rarely refresh inline.
+        self.token_manager = TokenManager(db, google_calendar_service, config)
         self.scheduler = BackgroundScheduler(timezone=pytz.utc)
+        # Bounded worker pool shared by every tick; per-user work never runs on the APScheduler thread.
+        self.executor = ThreadPoolExecutor(
+            max_workers=config.POLL_CONCURRENCY,
+            thread_name_prefix='calendar-poll'
+        )
+        # Users currently being polled, so a push-triggered refresh never overlaps a sweep for the same user.
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+        # Which owned user is due for a check when; see _next_check_at.
+        self.poll_queue = PollQueue()
+        self._users = {}
+        self._users_loaded_at = 0.0
+        # When each user's next known meeting crosses into the reminder window; prioritises overloaded ticks.
+        self._next_boundary_at = {}
+
+    @property
+    def push_enabled(self):
+        return self.watch_manager is not None and self.watch_manager.enabled
 
     def start(self):
+        self.delivery.start()
+        self.membership.heartbeat()
+        self.scheduler.add_job(
+            self.membership.heartbeat,
+            IntervalTrigger(seconds=self.config.WORKER_HEARTBEAT_INTERVAL_SECONDS),
+            id='worker_heartbeat_job',
+            name='Scheduler worker heartbeat',
+            replace_existing=True
+        )
+        self.scheduler.add_job(
+            self.token_manager.run,
+            IntervalTrigger(seconds=self.config.TOKEN_REFRESH_INTERVAL_SECONDS),
+            id='refresh_tokens_job',
+            name='Refresh Google access tokens',
+            next_run_time=datetime.datetime.now(pytz.utc),
+            replace_existing=True
+        )
+        self.scheduler.add_job(
+            functools.partial(
+                self.db.maintain_notification_partitions,
+                retention_days=self.config.SENT_NOTIFICATION_RETENTION_DAYS
+            ),
+            IntervalTrigger(hours=1),
+            id='notification_partitions_job',
+            name='Maintain sent_notifications partitions',
+            next_run_time=datetime.datetime.now(pytz.utc),
+            replace_existing=True
+        )
+        # Ticks are frequent but cheap: each one only polls the users whose check is due.
         self.scheduler.add_job(
             self._check_and_send_reminders,
-            IntervalTrigger(minutes=self.config.CALENDAR_CHECK_INTERVAL_MINUTES),
+            IntervalTrigger(seconds=self.config.SCHEDULER_TICK_SECONDS),
             id='check_calendars_job',
             name='Check Google Calendars',
+            # A tick that overruns (bounded by TICK_BUDGET_SECONDS) delays the next one rather
+            # than overlapping it, and missed runs collapse into one instead of queueing up.
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=self.config.SCHEDULER_TICK_SECONDS,
             replace_existing=True
         )
+        if self.push_enabled:
+            self.scheduler.add_job(
+                functools.partial(self.watch_manager.ensure_channels, owns=self.membership.owns),
+                IntervalTrigger(minutes=self.config.CALENDAR_WATCH_RENEW_INTERVAL_MINUTES),
+                id='renew_watch_channels_job',
+                name='Renew Calendar watch channels',
+                next_run_time=datetime.datetime.now(pytz.utc),
+                replace_existing=True
+            )
         self.scheduler.start()
-        logger.info(f"Scheduler started.")
+        logger.info(f"Scheduler started as worker {self.membership.worker_id}.")
 
     def shutdown(self):
         self.scheduler.shutdown()
+        self.executor.shutdown(wait=False)
+        self.delivery.stop(timeout=self.config.SLACK_DELIVERY_DRAIN_SECONDS)
+        self.membership.leave()
+
+    def user_connected(self, slack_user_id):
+        """Picks up a newly connected user on the next tick rather than at the next user reload."""
+        if not self.membership.owns(slack_user_id):
+            return
+        self._users_loaded_at = 0.0
+        if self.push_enabled:
+            self.executor.submit(self.watch_manager.ensure_channels, owns=self.membership.owns)
+
+    def refresh_user(self, slack_user_id):
+        """Re-polls a single user's calendar in the background, e.g. after a push notification."""
+        user_data = self.db.get_user(slack_user_id=slack_user_id)
+        if not user_data or not user_data.get('google_refresh_token') or user_data.get('token_dormant_at'):
+            return None
+        if not self.config.CALENDAR_INCREMENTAL_SYNC:
+            # Incremental sync fetches the changes anyway; the windowed fetch needs its cache dropped.
+            self.google_calendar.invalidate_events(slack_user_id)
+        future = self.executor.submit(self._refresh_and_notify, user_data)
+        # Callers (e.g. the NOTIFY listener) don't wait on the result, so report failures here.
+        future.add_done_callback(functools.partial(self._log_refresh_failure, slack_user_id))
+        return future
+
+    @staticmethod
+    def _log_refresh_failure(slack_user_id, future):
+        if future.cancelled() or future.exception() is None:
+            return
+        USER_POLL_FAILURES.inc()
+        logger.error(f"Error refreshing calendar for user {slack_user_id}: {future.exception()}", exc_info=future.exception())
+
+    def _refresh_and_notify(self, user_data):
+        slack_user_id = user_data['slack_user_id']
+        try:
+            meetings = self._process_user(user_data)
+        except Exception:
+            self.poll_queue.schedule(slack_user_id, time.time() + self._min_interval())
+            raise
+        reminders = self._reschedule(slack_user_id, meetings, time.time())
+        if reminders:
+            self._send_reminders({slack_user_id: reminders})
+
+    def _min_interval(self):
+        return self.config.CALENDAR_CHECK_INTERVAL_MINUTES * 60
+
+    def _max_interval(self):
+        # With push notifications on, idle polling is only a safety net for missed notifications.
+        minutes = self.config.CALENDAR_SAFETY_SWEEP_MINUTES if self.push_enabled else self.config.POLL_IDLE_MAX_INTERVAL_MINUTES
+        return max(minutes * 60, self._min_interval())
+
+    def _lookahead_hours(self):
+        """How far past the reminder window to fetch, so we know when the next meeting will enter it."""
+        return self.config.REMINDER_WINDOW_HOURS + self._max_interval() / 3600
+
+    def _next_check_at(self, meetings, now):
+        """
+        Schedules the next check for the moment the user's next known meeting crosses into
+        the reminder window, bounded by the min/max interval. With nothing coming up the user
+        sits at the max interval, jittered so idle calendars don't synchronise.
+        """
+        window = self.config.REMINDER_WINDOW_HOURS * 3600
+        boundaries = [m.start_ts - window for m in meetings]
+        upcoming = [b for b in boundaries if b > now]
+        if upcoming:
+            return min(max(min(upcoming), now + self._min_interval()), now + self._max_interval())
+        return now + self._max_interval() * random.uniform(0.9, 1.0)
+
+    def _prioritise(self, due, now):
+        """
+        Orders due (due_at, slack_user_id) entries for polling. Users whose next known meeting
+        enters the reminder window before their next check could run go first, soonest
+        first, since deferring them is what makes a reminder late; everyone else follows
+        oldest-due first.
+        """
+        urgent_before = now + self._min_interval()
+        def key(entry):
+            boundary = self._next_boundary_at.get(entry[1])
+            if boundary is not None and boundary <= urgent_before:
+                return (0, boundary)
+            return (1, entry[0])
+        return sorted(due, key=key)
+
+    def _reschedule(self, slack_user_id, meetings, now):
+        """Queues the user's next check and returns the meetings that are inside the reminder window."""
+        if meetings is None:
+            # Skipped: another poll for this user was in flight, or their token is backing off.
+            # Check again soon, or once the token manager's next attempt is due.
+            retry_at = now + self._min_interval()
+            user_data = self._users.get(slack_user_id)
+            if user_data and self.token_manager.in_backoff(user_data):
+                retry_at = min(max(retry_at, self.token_manager.retry_at(user_data)), now + self._max_interval())
+            self.poll_queue.schedule(slack_user_id, retry_at)
+            return []
+        self.poll_queue.schedule(slack_user_id, self._next_check_at(meetings, now))
+        window = self.config.REMINDER_WINDOW_HOURS * 3600
+        # Meetings already inside the window are handled by this poll; only the next crossing matters.
+        upcoming = [m.start_ts - window for m in meetings if m.start_ts - window > now]
+        if upcoming:
+            self._next_boundary_at[slack_user_id] = min(upcoming)
+        else:
+            self._next_boundary_at.pop(slack_user_id, None)
+        window_end = now + window
+        return [m for m in meetings if m.start_ts <= window_end]
+
+    def _load_users(self, now):
+        """Reloads the owned, authorized users and brings the poll queue in line with them."""
+        # Only poll the users this replica owns; cached state for the rest is dropped so a
+        # user that moves away and back later starts from a clean full sync.
+        self._users = {
+            u['slack_user_id']: u
+            for u in self.db.iter_authorized_users(batch_size=self.config.USER_STREAM_BATCH_SIZE)
+            if u['google_refresh_token'] and self.membership.owns(u['slack_user_id'])
+        }
+        self._users_loaded_at = now
+        # Pool threads update _next_boundary_at while this runs, so work from a copy of its keys.
+        for slack_user_id in [u for u in list(self._next_boundary_at) if u not in self._users]:
+            self._next_boundary_at.pop(slack_user_id, None)
+        self.google_calendar.retain_users(self._users)
+        self.poll_queue.sync_members(self._users, now, spread_seconds=self._min_interval())
 
     def _check_and_send_reminders(self):
-        logger.info("Running scheduled job: Checking calendars...")
-        authorized_users = self.db.get_all_authorized_users()
-
-        for user_data in authorized_users:
-            slack_user_id = user_data['slack_user_id']
-            refresh_token = user_data['google_refresh_token']
-            
-            if not refresh_token:
-                continue
-
-            try:
-                gc_service = self.google_calendar.get_calendar_service(
-                    refresh_token,
-                    self.config.GOOGLE_CLIENT_ID, self.config.GOOGLE_CLIENT_SECRET,
-                    "https://oauth2.googleapis.com/token", self.config.GOOGLE_SCOPES
-                )
-                
-                if not gc_service:
+        tick_started = time.monotonic()
+        now = time.time()
+        if now - self._users_loaded_at >= self.config.USER_RELOAD_INTERVAL_SECONDS:
+            self._load_users(now)
+
+        due = self.poll_queue.pop_due(now)
+        if not due:
+            return
+        # Empty ticks aren't worth a profile, so only ticks with work count against an armed profiler.
+        with self.profiler.session('tick'):
+            self._run_tick(due, now, tick_started)
+
+    def _run_tick(self, due, now, tick_started):
+        logger.info(f"Running scheduled job: checking {len(due)} of {len(self._users)} calendars...")
+
+        # Only this many users are in flight at once, so when the budget runs out nothing new
+        # starts and the tick ends within about one poll timeout of it.
+        budget_ends = tick_started + self.config.TICK_BUDGET_SECONDS
+        pending = collections.deque(self._prioritise(due, now))
+        futures = {}
+        polled = failed = 0
+        meetings_by_user = {}
+        while pending or futures:
+            while pending and len(futures) < self.config.POLL_CONCURRENCY and time.monotonic() < budget_ends:
+                _, slack_user_id = pending.popleft()
+                user_data = self._users.get(slack_user_id)
+                if not user_data:
                     continue
+                futures[self.executor.submit(self._process_user, user_data)] = slack_user_id
+            if not futures:
+                break
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                slack_user_id = futures.pop(future)
+                polled += 1
+                try:
+                    meetings = future.result()
+                except Exception as e:
+                    failed += 1
+                    USER_POLL_FAILURES.inc()
+                    logger.error(f"Error processing calendar for user {slack_user_id}: {e}", exc_info=True)
+                    self.poll_queue.schedule(slack_user_id, time.time() + self._min_interval())
+                    continue
+                reminders = self._reschedule(slack_user_id, meetings, time.time())
+                if reminders:
+                    MEETINGS_FOUND.inc(len(reminders))
+                    meetings_by_user[slack_user_id] = reminders
+
+        # Out of budget: the rest keep their original due times, so they sort ahead of
+        # anything that became due later and go first next tick.
+        for due_at, slack_user_id in pending:
+            self.poll_queue.schedule(slack_user_id, due_at)
+        deferred = len(pending)
+        USERS_DEFERRED.inc(deferred)
+        if deferred:
+            logger.warning(f"Tick budget of {self.config.TICK_BUDGET_SECONDS}s used up; deferred {deferred} users to the next tick.")
+
+        self._send_reminders(meetings_by_user)
+
+        elapsed = time.monotonic() - tick_started
+        store_stats = self.google_calendar.event_store.stats()
+        TICK_DURATION.observe(elapsed)
+        EVENT_STORE_EVENTS.set(store_stats['events'])
+        SLACK_QUEUE_DEPTH.set(self.delivery.stats()['depth'])
+        logger.info(
+            f"Finished checking {polled} calendars in {elapsed:.2f}s "
+            f"({failed} failed, {deferred} deferred, concurrency {self.config.POLL_CONCURRENCY}); "
+            f"event store: {store_stats}"
+        )
+
+    def _send_reminders(self, meetings_by_user):
+        """
+        Queues one prep request per unique meeting not already notified. Copies of the same
+        meeting on several users' calendars are merged by Meeting.key first, so traffic
+        scales with unique meetings rather than users x meetings. Dedup is set-based: one
+        query to find what was sent and one insert to claim this batch.
+        """
+        unique = {}
+        occurrences = 0
+        for meetings in meetings_by_user.values():
+            for meeting in meetings:
+                occurrences += 1
+                unique.setdefault(meeting.key, meeting)
+        if not unique:
+            return
+        # Reminders all go to one channel, so that is what a meeting is deduplicated against.
+        # The meeting start (naive UTC) locates the sent_notifications partition.
+        rows = [(self.channel_id, key, self._meeting_start(meeting)) for key, meeting in unique.items()]
+        already_sent = self.db.get_sent_notifications(rows)
+        new_rows = [row for row in rows if row[:2] not in already_sent]
+
+        # Claim before sending: only rows this insert wins get posted, so replicas that
+        # briefly overlap during a rebalance can't both send the same reminder. Claiming
+        # at enqueue time also keeps a backed-up queue from being fed the same reminder again.
+        claimed = self.db.record_notifications_sent(new_rows)
+        DEDUP_HITS.inc(occurrences - len(claimed))
+
+        to_send = sorted(unique[key] for _, key, _ in new_rows if (self.channel_id, key) in claimed)
+        window = self.config.REMINDER_WINDOW_HOURS * 3600
+        now = time.time()
+        for meeting in to_send:
+            REMINDER_LATENESS.observe(max(0.0, now - (meeting.start_ts - window)))
+        group_size = max(1, self.config.REMINDER_COALESCE_MAX_MEETINGS)
+        queued = 0
+        for i in range(0, len(to_send), group_size):
+            group = to_send[i:i + group_size]
+            for meeting in group:
+                logger.info(f"Meeting found: {meeting.summary}")
+
+            # If delivery is finally given up on, release the claims so a later tick tries again.
+            release = functools.partial(self._release_claims, group)
+            if self.delivery.enqueue(self.channel_id, self._prep_message(group), on_failure=release):
+                queued += len(group)
+            else:
+                logger.warning(f"Slack delivery queue full or stopped, deferring reminders for {len(group)} meetings")
+                release()
+
+        logger.info(
+            f"Queued {queued} prep requests for {occurrences} meetings across {len(meetings_by_user)} users; "
+            f"delivery stats: {self.delivery.stats()}"
+        )
+
+    @staticmethod
+    def _prep_message(meetings):
+        if len(meetings) == 1:
+            meeting = meetings[0]
+            attendee_text = ", ".join(meeting.attendee_emails)
+            return f"<@{GLEAN_BOT_ID}> Prep for meeting: '{meeting.summary}' with attendees: {attendee_text}"
+        lines = [f"<@{GLEAN_BOT_ID}> Prep for meetings:"]
+        for meeting in meetings:
+            lines.append(f"• '{meeting.summary}' with attendees: {', '.join(meeting.attendee_emails)}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _meeting_start(meeting):
+        return datetime.datetime.utcfromtimestamp(meeting.start_ts)
+
+    def _release_claims(self, meetings):
+        for meeting in meetings:
+            self.db.delete_notification_sent(self.channel_id, meeting.key, self._meeting_start(meeting))
+
+    def _process_user(self, user_data):
+        """
+        Polls one user's calendar and returns their meetings up to the lookahead horizon,
+        or None if the user was skipped (already being polled, or no usable token). Runs on the worker pool; the user's
+        USER_POLL_TIMEOUT_SECONDS starts when a worker picks them up, not when they were queued.
+        """
+        slack_user_id = user_data['slack_user_id']
+        with self._in_flight_lock:
+            if slack_user_id in self._in_flight:
+                logger.debug(f"Skipping {slack_user_id}: already being polled.")
+                return None
+            self._in_flight.add(slack_user_id)
+        try:
+            return self._poll_user(user_data, time.monotonic() + self.config.USER_POLL_TIMEOUT_SECONDS)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.discard(slack_user_id)
+
+    def _poll_user(self, user_data, deadline):
+        slack_user_id = user_data['slack_user_id']
+        if self.token_manager.in_backoff(user_data):
+            # A recent refresh failed; the token manager retries on its own schedule.
+            return None
+
+        gc_service = self.google_calendar.get_calendar_service(
+            user_data['google_refresh_token'],
+            self.config.GOOGLE_CLIENT_ID, self.config.GOOGLE_CLIENT_SECRET,
+            "https://oauth2.googleapis.com/token", self.config.GOOGLE_SCOPES,
+            timeout=self.config.USER_POLL_TIMEOUT_SECONDS, cache_key=slack_user_id,
+            access_token=user_data.get('google_access_token'),
+            token_expiry=user_data.get('google_token_expiry'),
+            on_refresh_error=functools.partial(self.token_manager.record_failure, slack_user_id)
+        )
+
+        if not gc_service:
+            return None
+
+        try:
+            if self.config.CALENDAR_INCREMENTAL_SYNC:
+                sync_token = user_data.get('google_sync_token')
+                upcoming_meetings, next_sync_token = self.google_calendar.sync_upcoming_meetings(
+                    gc_service, slack_user_id, sync_token, hours_ahead=self._lookahead_hours(), deadline=deadline
+                )
+                if next_sync_token and next_sync_token != sync_token:
+                    self.db.save_sync_token(slack_user_id, next_sync_token)
+                    # user_data is kept between ticks now, so keep its token current too.
+                    user_data['google_sync_token'] = next_sync_token
+            else:
+                upcoming_meetings = self.google_calendar.get_upcoming_meetings(
+                    gc_service, hours_ahead=self._lookahead_hours(), slack_user_id=slack_user_id, deadline=deadline
+                )
+        except HttpError as e:
+            # A 401 means the cached access token was revoked before it expired.
+            if e.resp.status == 401:
+                self.google_calendar.evict_user(slack_user_id)
+            raise
+
+        # Past the deadline the results are stale; the next tick will pick them up again.
+        if time.monotonic() > deadline:
+            raise UserDeadlineExceeded(f"calendar fetch for {slack_user_id} overran its deadline")
 
-                upcoming_meetings = self.google_calendar.get_upcoming_meetings(gc_service, hours_ahead=self.config.REMINDER_WINDOW_HOURS)
-                
-                for meeting in upcoming_meetings:
-                    # By commenting out the check and the record, this will now always send a message for found meetings.
-                    # if not self.db.has_notification_been_sent(slack_user_id, meeting['id']):
-                    logger.info(f"Meeting found for {slack_user_id}: {meeting['summary']}")
-                    
-                    attendee_emails = [a['email'] for a in meeting['attendees'] if a.get('email')]
-                    attendee_text = ", ".join(attendee_emails)
-                    
-                    message_text = f"<@{GLEAN_BOT_ID}> Prep for meeting: '{meeting['summary']}' with attendees: {attendee_text}"
-                    
-                    self.slack_client.chat_postMessage(channel=SLACK_CHANNEL_ID, text=message_text)
-                    logger.info(f"Posted prep request to Glean channel for meeting '{meeting['summary']}'")
-                    
-                    # self.db.record_notification_sent(slack_user_id, meeting['id'])
-
-            except Exception as e:
-                logger.error(f"Error processing calendar for user {slack_user_id}: {e}", exc_info=True)
\ No newline at end of file
+        return upcoming_meetings
@@ -0,0 +1,240 @@
+import collections
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from slack_sdk.errors import SlackApiError
+
+from metrics import REMINDERS_POSTED, SLACK_POST_LATENCY
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most `capacity`.
+    Not thread-safe on its own; SlackDeliveryQueue guards it with its lock.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def take(self, now):
+        """Takes a token and returns 0, or returns how many seconds until one is available."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        # `now` may predate the bucket's creation when read just before it, so never refill backwards.
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated_at) * self.rate)
+        self.updated_at = max(self.updated_at, now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, until):
+        """Holds the bucket empty until `until`, e.g. for a Slack Retry-After."""
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 0
+        self.updated_at = until
+
+class _Delivery:
+    __slots__ = ('channel', 'text', 'enqueued_at', 'attempts', 'on_failure')
+
+    def __init__(self, channel, text, on_failure):
+        self.channel = channel
+        self.text = text
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.on_failure = on_failure
+
+class SlackDeliveryQueue:
+    """
+    In-process outbound queue for chat.postMessage. Producers enqueue and return
+    immediately; worker threads post at most `rate_per_second` messages per channel,
+    honour Retry-After on 429s, and retry transient failures a bounded number of times.
+    Every message ends up either posted or passed to its on_failure, including the ones
+    still queued when the queue is stopped.
+    """
+    def __init__(self, slack_client, workers=2, rate_per_second=1.0, burst=1, max_retries=3, max_queue_size=10000):
+        self.slack_client = slack_client
+        self.worker_count = workers
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.max_queue_size = max_queue_size
+
+        # Heap of (ready_at, seq, delivery): retries and rate-limited posts wait here without holding a worker.
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._buckets = {}
+        self._threads = []
+        self._running = False
+        # Set by stop(): workers keep posting until then, and queued messages after it are failed.
+        self._drain_until = None
+
+        self._counters = collections.Counter()
+        self._latencies = collections.deque(maxlen=1000)
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._drain_until = None
+        for i in range(self.worker_count):
+            thread = threading.Thread(target=self._worker, name=f'slack-delivery-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Slack delivery queue started with {self.worker_count} workers.")
+
+    def stop(self, timeout=5):
+        """
+        Stops accepting messages and keeps posting the queued ones for up to `timeout`
+        seconds. Whatever is still queued after that is handed to its on_failure, so the
+        caller can release it for another process to send.
+        """
+        with self._cond:
+            self._running = False
+            self._drain_until = time.monotonic() + timeout
+            self._cond.notify_all()
+        for thread in self._threads:
+            # Allow a post that is already under way to finish.
+            thread.join(max(0.0, self._drain_until - time.monotonic()) + 1)
+        self._threads = []
+        with self._cond:
+            undelivered = [delivery for _, _, delivery in self._heap]
+            self._heap = []
+        if undelivered:
+            logger.warning(f"Slack delivery queue stopped with {len(undelivered)} messages undelivered; releasing them.")
+        for delivery in undelivered:
+            self._fail(delivery)
+
+    def enqueue(self, channel, text, on_failure=None):
+        """
+        Queues a message for delivery. Returns False if the queue is full or stopped.
+        on_failure is called with no arguments if the message is finally given up on.
+        """
+        with self._cond:
+            if not self._running:
+                self._counters['rejected'] += 1
+                return False
+            if len(self._heap) >= self.max_queue_size:
+                self._counters['dropped'] += 1
+                return False
+            delivery = _Delivery(channel, text, on_failure)
+            heapq.heappush(self._heap, (delivery.enqueued_at, next(self._seq), delivery))
+            self._counters['enqueued'] += 1
+            self._cond.notify()
+        return True
+
+    def stats(self):
+        """Snapshot of queue depth, outcome counters and enqueue-to-post latency in seconds."""
+        with self._cond:
+            depth = len(self._heap)
+            counters = dict(self._counters)
+            latencies = sorted(self._latencies)
+        stats = {'depth': depth, **counters}
+        if latencies:
+            stats['latency_p50'] = latencies[len(latencies) // 2]
+            stats['latency_p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            stats['latency_max'] = latencies[-1]
+        return stats
+
+    def _worker(self):
+        while True:
+            delivery = self._next_ready()
+            if delivery is None:
+                return
+            self._post(delivery)
+
+    def _next_ready(self):
+        """
+        Blocks until a message is due and its channel has a token, then returns it. Returns
+        None once the queue is stopped and either empty or past its drain deadline.
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if not self._running and (not self._heap or now >= self._drain_until):
+                    return None
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                ready_at, _, delivery = self._heap[0]
+                if ready_at > now:
+                    self._cond.wait(ready_at - now if self._running else min(ready_at, self._drain_until) - now)
+                    continue
+                heapq.heappop(self._heap)
+                wait = self._bucket(delivery.channel).take(now)
+                if wait > 0:
+                    heapq.heappush(self._heap, (now + wait, next(self._seq), delivery))
+                    continue
+                return delivery
+
+    def _bucket(self, channel):
+        bucket = self._buckets.get(channel)
+        if bucket is None:
+            bucket = self._buckets[channel] = TokenBucket(self.rate_per_second, self.burst)
+        return bucket
+
+    def _post(self, delivery):
+        delivery.attempts += 1
+        try:
+            with SLACK_POST_LATENCY.time():
+                self.slack_client.chat_postMessage(channel=delivery.channel, text=delivery.text)
+        except SlackApiError as e:
+            status = e.response.status_code
+            if status == 429:
+                retry_after = float(e.response.headers.get('Retry-After', 1))
+                logger.warning(f"Slack rate limited channel {delivery.channel}, retrying after {retry_after}s.")
+                with self._cond:
+                    self._counters['rate_limited'] += 1
+                    self._bucket(delivery.channel).pause(time.monotonic() + retry_after)
+                self._retry(delivery, retry_after)
+            elif status >= 500:
+                self._retry(delivery, self._backoff(delivery))
+            else:
+                logger.error(f"Slack rejected message to {delivery.channel}: {e.response.get('error')}")
+                self._fail(delivery)
+        except Exception as e:
+            # Network errors and timeouts are worth another try.
+            logger.warning(f"Error posting to Slack channel {delivery.channel}: {e}")
+            self._retry(delivery, self._backoff(delivery))
+        else:
+            REMINDERS_POSTED.inc()
+            with self._cond:
+                self._counters['delivered'] += 1
+                self._latencies.append(time.monotonic() - delivery.enqueued_at)
+
+    def _backoff(self, delivery):
+        return min(60, 2 ** delivery.attempts)
+
+    def _retry(self, delivery, delay):
+        if delivery.attempts > self.max_retries:
+            logger.error(f"Giving up on Slack message to {delivery.channel} after {delivery.attempts} attempts.")
+            self._fail(delivery)
+            return
+        with self._cond:
+            ready_at = time.monotonic() + delay
+            # Past stop()'s drain deadline nothing will pick a retry up again.
+            stopped = not self._running and ready_at >= self._drain_until
+            if not stopped:
+                self._counters['retried'] += 1
+                heapq.heappush(self._heap, (ready_at, next(self._seq), delivery))
+                self._cond.notify()
+        if stopped:
+            self._fail(delivery)
+
+    def _fail(self, delivery):
+        with self._cond:
+            self._counters['failed'] += 1
+        if delivery.on_failure:
+            try:
+                delivery.on_failure()
+            except Exception as e:
+                logger.error(f"Error in Slack delivery failure callback: {e}", exc_info=True)
@@ -0,0 +1,95 @@
+import datetime
+
+from calendar_push import CalendarWatchManager
+
+class Config:
+    GOOGLE_WATCH_ADDRESS = 'https://example.com/google/calendar/notifications'
+    GOOGLE_CLIENT_ID = 'client'
+    GOOGLE_CLIENT_SECRET = 'secret'
+    GOOGLE_SCOPES = []
+    CALENDAR_WATCH_TTL_HOURS = 24
+    CALENDAR_WATCH_RENEW_BEFORE_HOURS = 12
+    USER_POLL_TIMEOUT_SECONDS = 7
+
+class FakeDB:
+    def __init__(self, needing_watch=(), orphaned=(), channels=None):
+        self.needing_watch = list(needing_watch)
+        self.orphaned = list(orphaned)
+        self.channels = channels or {}
+        self.deleted = []
+        self.saved = []
+
+    def get_users_needing_watch(self, renew_before):
+        return self.needing_watch
+
+    def get_orphaned_watch_channels(self):
+        return self.orphaned
+
+    def get_watch_channels_for_user(self, slack_user_id):
+        return self.channels.get(slack_user_id, [])
+
+    def save_watch_channel(self, channel_id, slack_user_id, resource_id, channel_token, expiration):
+        self.saved.append((slack_user_id, resource_id))
+
+    def delete_watch_channel(self, channel_id):
+        self.deleted.append(channel_id)
+
+class FakeRequest:
+    def __init__(self, result=None):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+class FakeService:
+    def __init__(self):
+        self.stopped = []
+
+    def events(self):
+        return self
+
+    def channels(self):
+        return self
+
+    def watch(self, calendarId, body):
+        return FakeRequest({'resourceId': 'resource', 'expiration': '1735689600000'})
+
+    def stop(self, body):
+        self.stopped.append(body['id'])
+        return FakeRequest()
+
+class FakeCalendar:
+    def __init__(self):
+        self.service = FakeService()
+        self.calls = []
+
+    def get_calendar_service(self, refresh_token, *args, **kwargs):
+        self.calls.append(kwargs)
+        return self.service
+
+def test_watch_uses_cached_credentials_with_a_timeout():
+    expiry = datetime.datetime(2025, 1, 1)
+    db = FakeDB(
+        needing_watch=[{'slack_user_id': 'U1', 'google_refresh_token': 'r', 'google_access_token': 'a', 'google_token_expiry': expiry}],
+        channels={'U1': [{'channel_id': 'old', 'resource_id': 'resource'}]},
+    )
+    calendar = FakeCalendar()
+    CalendarWatchManager(db, calendar, Config).ensure_channels()
+    assert calendar.calls == [{'timeout': 7, 'cache_key': 'U1', 'access_token': 'a', 'token_expiry': expiry}]
+    assert db.saved == [('U1', 'resource')]
+    assert calendar.service.stopped == ['old'] and db.deleted == ['old']
+
+def test_orphaned_channels_of_owned_users_are_dropped():
+    db = FakeDB(orphaned=[
+        {'channel_id': 'c1', 'slack_user_id': 'U1', 'resource_id': 'r1'},
+        {'channel_id': 'c2', 'slack_user_id': 'U2', 'resource_id': 'r2'},
+    ])
+    CalendarWatchManager(db, FakeCalendar(), Config).ensure_channels(owns=lambda slack_user_id: slack_user_id == 'U2')
+    assert db.deleted == ['c2']
+
+def test_disabled_without_a_watch_address():
+    class Disabled(Config):
+        GOOGLE_WATCH_ADDRESS = None
+    db = FakeDB(orphaned=[{'channel_id': 'c1', 'slack_user_id': 'U1', 'resource_id': 'r1'}])
+    CalendarWatchManager(db, FakeCalendar(), Disabled).ensure_channels()
+    assert not db.deleted
@@ -0,0 +1,60 @@
+import time
+
+from event_store import EventStore
+from models import Meeting
+
+def meeting(event_id, start_ts):
+    return Meeting(start_ts, start_ts + 1800, event_id, event_id, (), None, None)
+
+def test_query_returns_meetings_in_range_in_start_order():
+    store = EventStore()
+    store.replace('U1', [meeting('c', 300), meeting('a', 100), meeting('b', 200)], window_end=1000)
+    assert [m.id for m in store.query('U1', 100, 200)] == ['a', 'b']
+    assert [m.id for m in store.query('U1', 150, 1000)] == ['b', 'c']
+    assert store.query('U1', 400, 500) == []
+
+def test_query_misses_unknown_user_short_window_and_stale_entry():
+    store = EventStore()
+    assert store.query('U1', 0, 10) is None
+    store.replace('U1', [meeting('a', 100)], window_end=500, fetched_at=time.time() - 120)
+    assert store.query('U1', 0, 600) is None
+    assert store.query('U1', 0, 500, max_age=60) is None
+    assert store.query('U1', 0, 500, max_age=300) == [meeting('a', 100)]
+    stats = store.stats()
+    assert (stats['hits'], stats['misses']) == (1, 3)
+
+def test_apply_changes_upserts_moves_and_removes():
+    store = EventStore()
+    assert not store.apply_changes('U1', [meeting('a', 100)], [])
+    store.replace('U1', [meeting('a', 100), meeting('b', 200)], window_end=1000)
+    assert store.apply_changes('U1', [meeting('a', 400), meeting('c', 300)], ['b'])
+    assert [(m.id, m.start_ts) for m in store.query('U1', 0, 1000)] == [('c', 300), ('a', 400)]
+    assert store.stats()['events'] == 2
+
+def test_trim_drops_past_meetings():
+    store = EventStore()
+    store.replace('U1', [meeting('a', 100), meeting('b', 200), meeting('c', 300)], window_end=1000)
+    store.trim('U1', 200)
+    assert [m.id for m in store.query('U1', 0, 1000)] == ['b', 'c']
+    assert store.stats()['events'] == 2
+
+def test_evicts_least_recently_used_users_over_cap():
+    store = EventStore(max_events=4)
+    store.replace('U1', [meeting('a', 100), meeting('b', 200)], window_end=1000)
+    store.replace('U2', [meeting('c', 100), meeting('d', 200)], window_end=1000)
+    store.query('U1', 0, 1000)
+    store.replace('U3', [meeting('e', 100)], window_end=1000)
+    assert store.window_end('U2') is None
+    assert store.window_end('U1') == 1000 and store.window_end('U3') == 1000
+    stats = store.stats()
+    assert (stats['users'], stats['events'], stats['evictions']) == (2, 3, 1)
+
+def test_invalidate_and_retain():
+    store = EventStore()
+    for user in ('U1', 'U2', 'U3'):
+        store.replace(user, [meeting('a', 100)], window_end=1000)
+    store.invalidate('U1')
+    store.retain(['U2'])
+    assert store.window_end('U2') == 1000
+    assert store.stats()['users'] == 1 and store.stats()['events'] == 1
+    assert store.stats()['invalidations'] == 1
@@ -0,0 +1,133 @@
+import time
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from bench.fakes import FakeCalendarBackend, FakeGoogleCalendar
+from google_calendar import EVENT_FIELDS, PAGE_SIZE, SYNC_WINDOW_HOURS, UserDeadlineExceeded
+
+def http_error(status):
+    return HttpError(httplib2.Response({'status': status}), b'error')
+
+class RecordingBackend(FakeCalendarBackend):
+    """
+    Records the params of every events().list call. Incremental syncs return `changes`,
+    or raise `sync_error` if set.
+    """
+    def __init__(self, users, **kwargs):
+        super().__init__(users, change_rate=0.0, **kwargs)
+        self.calls = []
+        self.changes = []
+        self.sync_error = None
+
+    def list_events(self, slack_user_id, params):
+        self.calls.append(dict(params))
+        if params.get('syncToken'):
+            if self.sync_error:
+                raise self.sync_error
+            if self.changes:
+                items, self.changes = self.changes, []
+                return {'items': items, 'nextSyncToken': 'after-changes'}
+        return super().list_events(slack_user_id, params)
+
+@pytest.fixture
+def backend():
+    return RecordingBackend(['U1'], events_per_user=30)
+
+@pytest.fixture
+def calendar(backend):
+    return FakeGoogleCalendar(backend)
+
+def sync(calendar, backend, sync_token, hours_ahead=24):
+    return calendar.sync_upcoming_meetings(backend.service_for('U1'), 'U1', sync_token, hours_ahead=hours_ahead)
+
+def test_first_sync_is_full_then_incremental(calendar, backend):
+    meetings, token = sync(calendar, backend, None)
+    assert token and meetings
+    assert 'syncToken' not in backend.calls[-1] and backend.calls[-1]['timeMin']
+    again, next_token = sync(calendar, backend, token)
+    assert backend.calls[-1]['syncToken'] == token
+    assert next_token != token
+    assert again == meetings
+
+def test_incremental_sync_applies_changes(calendar, backend):
+    meetings, token = sync(calendar, backend, None)
+    cancelled, renamed = meetings[0], meetings[1]
+    events = backend._calendars['U1']
+    backend.changes = [
+        dict(events[cancelled.id], status='cancelled'),
+        dict(events[renamed.id], summary='Renamed'),
+    ]
+    updated, next_token = sync(calendar, backend, token)
+    assert next_token == 'after-changes'
+    assert cancelled.id not in {m.id for m in updated}
+    assert [m.summary for m in updated if m.id == renamed.id] == ['Renamed']
+    assert len(updated) == len(meetings) - 1
+
+def test_expired_sync_token_falls_back_to_full_sync(calendar, backend):
+    meetings, token = sync(calendar, backend, None)
+    backend.sync_error = http_error(410)
+    resynced, next_token = sync(calendar, backend, token)
+    assert backend.calls[-2].get('syncToken') == token
+    assert 'syncToken' not in backend.calls[-1]
+    assert next_token and next_token != token
+    assert resynced == meetings
+
+def test_other_sync_errors_propagate(calendar, backend):
+    _, token = sync(calendar, backend, None)
+    backend.sync_error = http_error(503)
+    with pytest.raises(HttpError):
+        sync(calendar, backend, token)
+
+def test_window_no_longer_covering_lookahead_forces_full_sync(calendar, backend):
+    _, token = sync(calendar, backend, None)
+    calls = len(backend.calls)
+    sync(calendar, backend, token, hours_ahead=SYNC_WINDOW_HOURS + 1)
+    assert len(backend.calls) == calls + 1
+    assert 'syncToken' not in backend.calls[-1]
+
+def test_cold_store_forces_full_sync(calendar, backend):
+    _, token = sync(calendar, backend, None)
+    calendar.invalidate_events('U1')
+    sync(calendar, backend, token)
+    assert 'syncToken' not in backend.calls[-1]
+
+@pytest.fixture
+def big_backend():
+    # Shared meetings repeat some ids, so this is comfortably more than two pages of distinct events.
+    backend = RecordingBackend(['U1'], events_per_user=3 * PAGE_SIZE)
+    assert 2 * PAGE_SIZE < len(backend._calendars['U1']) <= 3 * PAGE_SIZE
+    return backend
+
+def test_iter_events_follows_page_tokens(big_backend):
+    calendar = FakeGoogleCalendar(big_backend)
+    page_state = {}
+    events = list(calendar.iter_events(big_backend.service_for('U1'), page_state, timeMin='2000-01-01T00:00:00+00:00'))
+    assert [call.get('pageToken') for call in big_backend.calls] == [None, str(PAGE_SIZE), str(2 * PAGE_SIZE)]
+    assert len(events) == page_state['events'] == len({e['id'] for e in events})
+    assert page_state['next_sync_token']
+    first = big_backend.calls[0]
+    assert first['maxResults'] == PAGE_SIZE and EVENT_FIELDS in first['fields']
+
+def test_full_sync_reads_every_page(big_backend):
+    calendar = FakeGoogleCalendar(big_backend)
+    calendar.sync_upcoming_meetings(big_backend.service_for('U1'), 'U1', None, hours_ahead=24)
+    assert len(big_backend.calls) == 3
+    assert calendar.event_store.stats()['events'] == len(big_backend._calendars['U1'])
+
+def test_iter_events_stops_paging_past_the_deadline(big_backend):
+    calendar = FakeGoogleCalendar(big_backend)
+    events = calendar.iter_events(big_backend.service_for('U1'), deadline=time.monotonic() + 0.2)
+    for _ in range(PAGE_SIZE):
+        next(events)
+    time.sleep(0.3)
+    with pytest.raises(UserDeadlineExceeded):
+        list(events)
+    assert len(big_backend.calls) == 1
+
+def test_sync_past_the_deadline_leaves_the_store_alone(big_backend):
+    calendar = FakeGoogleCalendar(big_backend)
+    with pytest.raises(UserDeadlineExceeded):
+        calendar.sync_upcoming_meetings(big_backend.service_for('U1'), 'U1', None, deadline=time.monotonic() - 1)
+    assert calendar.event_store.window_end('U1') is None
@@ -0,0 +1,40 @@
+import pytest
+
+from models import Attendee, Meeting, parse_event_time
+
+def test_parse_event_time_offsets_and_utc():
+    assert parse_event_time('2025-07-15T10:00:00-07:00') == 1752598800
+    assert parse_event_time('2025-07-15T17:00:00Z') == 1752598800
+    assert parse_event_time('2025-07-15T17:00:00z') == 1752598800
+    assert parse_event_time('2025-07-15T17:00:00.500+00:00') == 1752598800
+
+def test_parse_event_time_all_day_is_midnight_utc():
+    assert parse_event_time('2025-07-15') == 1752537600
+
+@pytest.mark.parametrize('value', ['2025-07-15T10:00:00', 'not a time', '2025-13-01'])
+def test_parse_event_time_rejects_malformed(value):
+    with pytest.raises(ValueError):
+        parse_event_time(value)
+
+def test_meeting_key_shared_across_calendars_and_bounded():
+    mine = Meeting(100, 200, 'event-a', 'Sync', (), None, 'uid@example.com')
+    theirs = mine._replace(id='event-b')
+    assert mine.key == theirs.key == 'uid@example.com/100'
+    assert mine._replace(start_ts=200).key != mine.key
+    assert mine._replace(ical_uid=None).key == 'event-a/100'
+    assert len(mine._replace(ical_uid='x' * 300).key) == 40
+
+def test_meetings_order_by_start_and_hash_by_id_and_start():
+    early = Meeting(100, 200, 'b', 'B', (), None, None)
+    late = Meeting(150, 300, 'a', 'A', (), None, None)
+    assert sorted([late, early]) == [early, late]
+    assert len({early, early._replace(summary='renamed'), late}) == 3
+    assert early.start_dt.isoformat() == '1970-01-01T00:01:40+00:00'
+
+def test_attendee_from_event_interns_email():
+    first = Attendee.from_event({'email': ''.join(['a', '@example.com']), 'displayName': 'A'})
+    second = Attendee.from_event({'email': ''.join(['a', '@example.c', 'om'])})
+    assert first.email is second.email
+    assert second.display_name is None
+    meeting = Meeting(0, 1, 'e', 'S', (first, second), None, None)
+    assert meeting.attendee_emails == ['a@example.com', 'a@example.com']
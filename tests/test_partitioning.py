@@ -0,0 +1,74 @@
+import collections
+
+from partitioning import HashRing, WorkerMembership
+
+KEYS = [f'U{i:05d}' for i in range(5000)]
+
+def test_empty_ring_has_no_owner():
+    assert HashRing([]).owner('U1') is None
+
+def test_owner_is_stable_and_spread_across_members():
+    ring = HashRing(['a', 'b', 'c'])
+    owners = collections.Counter(ring.owner(key) for key in KEYS)
+    assert set(owners) == {'a', 'b', 'c'}
+    assert min(owners.values()) > len(KEYS) / 3 * 0.6
+    assert all(HashRing(['c', 'a', 'b']).owner(key) == ring.owner(key) for key in KEYS)
+
+def test_adding_a_member_only_moves_keys_to_it():
+    before = HashRing(['a', 'b', 'c'])
+    after = HashRing(['a', 'b', 'c', 'd'])
+    moved = [key for key in KEYS if before.owner(key) != after.owner(key)]
+    assert all(after.owner(key) == 'd' for key in moved)
+    assert len(moved) < len(KEYS) / 2
+
+class FakeDB:
+    def __init__(self, live):
+        self.live = live
+        self.removed = []
+
+    def heartbeat_worker(self, worker_id, ttl_seconds):
+        return list(self.live)
+
+    def remove_worker(self, worker_id):
+        self.removed.append(worker_id)
+
+def test_membership_owns_everything_alone_then_splits():
+    db = FakeDB(['w1', 'w2'])
+    membership = WorkerMembership(db, worker_id='w1')
+    assert all(membership.owns(key) for key in KEYS[:100])
+    membership.heartbeat()
+    ring = HashRing(['w1', 'w2'])
+    assert all(membership.owns(key) == (ring.owner(key) == 'w1') for key in KEYS[:100])
+
+def test_membership_keeps_ring_when_heartbeat_fails():
+    class FailingDB(FakeDB):
+        def heartbeat_worker(self, worker_id, ttl_seconds):
+            raise RuntimeError("database down")
+    membership = WorkerMembership(FailingDB([]), worker_id='w1')
+    membership.heartbeat()
+    assert membership.owns('U1')
+
+def test_membership_includes_itself_and_leaves():
+    db = FakeDB(['w2'])
+    membership = WorkerMembership(db, worker_id='w1')
+    membership.heartbeat()
+    assert membership._ring.members == {'w1', 'w2'}
+    membership.leave()
+    assert db.removed == ['w1']
+
+def test_removing_a_member_only_moves_its_keys():
+    before = HashRing(['a', 'b', 'c'])
+    after = HashRing(['a', 'b'])
+    assert all(after.owner(key) == before.owner(key) for key in KEYS if before.owner(key) != 'c')
+
+def test_membership_rebuilds_ring_only_on_change():
+    db = FakeDB(['w1', 'w2'])
+    membership = WorkerMembership(db, worker_id='w1')
+    membership.heartbeat()
+    ring = membership._ring
+    membership.heartbeat()
+    assert membership._ring is ring
+    db.live = ['w1']
+    membership.heartbeat()
+    assert membership._ring.members == {'w1'}
+    assert all(membership.owns(key) for key in KEYS[:100])
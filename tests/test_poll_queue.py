@@ -0,0 +1,53 @@
+from poll_queue import PollQueue
+
+def test_pop_due_returns_due_users_earliest_first():
+    queue = PollQueue()
+    queue.schedule('U2', 20)
+    queue.schedule('U1', 10)
+    queue.schedule('U3', 30)
+    assert queue.pop_due(25) == [(10, 'U1'), (20, 'U2')]
+    assert len(queue) == 1
+    assert 'U1' not in queue and 'U3' in queue
+
+def test_pop_due_respects_limit():
+    queue = PollQueue()
+    for i in range(5):
+        queue.schedule(f'U{i}', i)
+    assert [u for _, u in queue.pop_due(10, limit=2)] == ['U0', 'U1']
+    assert len(queue) == 3
+
+def test_reschedule_skips_stale_entries():
+    queue = PollQueue()
+    queue.schedule('U1', 10)
+    queue.schedule('U1', 50)
+    assert queue.pop_due(20) == []
+    assert queue.next_due() == 50
+    assert queue.pop_due(50) == [(50, 'U1')]
+    assert queue.next_due() is None
+
+def test_remove_drops_user():
+    queue = PollQueue()
+    queue.schedule('U1', 10)
+    queue.remove('U1')
+    queue.remove('U1')
+    assert len(queue) == 0
+    assert queue.pop_due(100) == []
+
+def test_sync_members_adds_spread_newcomers_and_drops_leavers():
+    queue = PollQueue()
+    queue.schedule('U1', 5)
+    queue.schedule('gone', 5)
+    queue.sync_members(['U1', 'U2', 'U3'], now=100, spread_seconds=60)
+    assert len(queue) == 3 and 'gone' not in queue
+    due = dict((u, t) for t, u in queue.pop_due(1000))
+    # Existing members keep their due time; newcomers land within the spread.
+    assert due['U1'] == 5
+    assert 100 <= due['U2'] <= 160 and 100 <= due['U3'] <= 160
+
+def test_sync_members_compacts_heap():
+    queue = PollQueue()
+    for t in range(1000):
+        queue.schedule('U1', t)
+    queue.sync_members(['U1'], now=0, spread_seconds=0)
+    assert len(queue._heap) == 1
+    assert queue.pop_due(2000) == [(999, 'U1')]
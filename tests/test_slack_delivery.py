@@ -0,0 +1,137 @@
+import threading
+import time
+
+from slack_sdk.errors import SlackApiError
+
+from slack_delivery import SlackDeliveryQueue, TokenBucket
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, error='error'):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.data = {'ok': False, 'error': error}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+class FakeSlackClient:
+    """Records posts; pops one scripted exception (or None for success) per call."""
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.posts = []
+        self.lock = threading.Lock()
+
+    def chat_postMessage(self, channel, text):
+        with self.lock:
+            error = self.failures.pop(0) if self.failures else None
+            if error is not None:
+                raise error
+            self.posts.append((time.monotonic(), channel, text))
+
+def api_error(status, headers=None):
+    return SlackApiError('fail', FakeResponse(status, headers))
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def make_queue(client, **kwargs):
+    kwargs.setdefault('rate_per_second', 1000)
+    kwargs.setdefault('burst', 1000)
+    queue = SlackDeliveryQueue(client, workers=1, **kwargs)
+    # Retry immediately rather than after seconds of exponential backoff.
+    queue._backoff = lambda delivery: 0
+    queue.start()
+    return queue
+
+def test_token_bucket_bursts_then_refills():
+    bucket = TokenBucket(rate=2, capacity=2)
+    now = bucket.updated_at
+    assert bucket.take(now) == 0 and bucket.take(now) == 0
+    assert bucket.take(now) == 0.5
+    assert bucket.take(now + 0.5) == 0
+
+def test_token_bucket_pause_holds_it_empty():
+    bucket = TokenBucket(rate=10, capacity=5)
+    now = bucket.updated_at
+    bucket.pause(now + 3)
+    assert bucket.take(now + 1) == 2
+    assert bucket.take(now + 3) == 0.1
+
+def test_token_bucket_ignores_time_before_creation():
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.take(bucket.updated_at - 1) == 0
+
+def test_delivers_in_order():
+    client = FakeSlackClient()
+    queue = make_queue(client)
+    for i in range(3):
+        assert queue.enqueue('C1', f'm{i}')
+    assert wait_for(lambda: len(client.posts) == 3)
+    assert [text for _, _, text in client.posts] == ['m0', 'm1', 'm2']
+    queue.stop()
+    assert queue.stats()['delivered'] == 3
+
+def test_rate_limit_pauses_channel_for_retry_after():
+    client = FakeSlackClient([api_error(429, {'Retry-After': '0.3'})])
+    queue = make_queue(client)
+    started = time.monotonic()
+    queue.enqueue('C1', 'hello')
+    assert wait_for(lambda: client.posts)
+    assert client.posts[0][0] - started >= 0.3
+    stats = queue.stats()
+    queue.stop()
+    assert stats['rate_limited'] == 1 and stats['retried'] == 1 and stats['delivered'] == 1
+
+def test_server_errors_retry_then_give_up_and_release():
+    released = []
+    client = FakeSlackClient([api_error(500)] * 3)
+    queue = make_queue(client, max_retries=2)
+    queue.enqueue('C1', 'hello', on_failure=lambda: released.append('hello'))
+    assert wait_for(lambda: released)
+    queue.stop()
+    assert released == ['hello'] and not client.posts
+    stats = queue.stats()
+    assert stats['retried'] == 2 and stats['failed'] == 1
+
+def test_client_errors_are_not_retried():
+    released = []
+    client = FakeSlackClient([api_error(400), None])
+    queue = make_queue(client)
+    queue.enqueue('C1', 'bad', on_failure=lambda: released.append('bad'))
+    assert wait_for(lambda: released)
+    queue.stop()
+    assert not client.posts and 'retried' not in queue.stats()
+
+def test_full_queue_rejects():
+    # No workers, so nothing leaves the queue.
+    queue = SlackDeliveryQueue(FakeSlackClient(), workers=0, max_queue_size=1)
+    queue.start()
+    assert queue.enqueue('C1', 'a')
+    assert not queue.enqueue('C1', 'b')
+    assert queue.stats()['dropped'] == 1
+
+def test_stop_drains_queued_messages():
+    client = FakeSlackClient()
+    queue = make_queue(client, rate_per_second=20, burst=1)
+    for i in range(5):
+        queue.enqueue('C1', f'm{i}')
+    queue.stop(timeout=2)
+    assert len(client.posts) == 5
+    assert queue.stats()['depth'] == 0
+
+def test_stop_releases_what_it_cannot_send_and_rejects_new_messages():
+    released = []
+    client = FakeSlackClient()
+    queue = make_queue(client, rate_per_second=2, burst=1)
+    for i in range(10):
+        queue.enqueue('C1', f'm{i}', on_failure=lambda i=i: released.append(i))
+    queue.stop(timeout=0.3)
+    assert len(client.posts) + len(released) == 10
+    assert released and queue.stats()['depth'] == 0
+    assert not queue.enqueue('C1', 'late', on_failure=lambda: released.append('late'))
+    assert 'late' not in released and queue.stats()['rejected'] == 1
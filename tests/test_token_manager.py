@@ -0,0 +1,124 @@
+import datetime
+import os
+import uuid
+
+import pytest
+
+from token_manager import TokenManager, is_invalid_grant
+
+class Config:
+    TOKEN_RETRY_BASE_SECONDS = 60
+    TOKEN_RETRY_MAX_SECONDS = 3600
+    TOKEN_DORMANT_AFTER_FAILURES = 3
+    USER_POLL_TIMEOUT_SECONDS = 5
+
+class FakeDB:
+    def __init__(self, dormant=False):
+        self.dormant = dormant
+        self.failures = []
+        self.notified = []
+
+    def record_token_failure(self, slack_user_id, now, invalid_grant, **kwargs):
+        self.failures.append((slack_user_id, invalid_grant))
+        return len(self.failures), self.dormant
+
+    def notify(self, channel, payload):
+        self.notified.append((channel, payload))
+
+class FakeCalendar:
+    def __init__(self):
+        self.evicted = []
+
+    def evict_user(self, slack_user_id):
+        self.evicted.append(slack_user_id)
+
+def utcnow():
+    return datetime.datetime.utcnow()
+
+def test_in_backoff_only_while_the_stored_token_is_unusable():
+    later = utcnow() + datetime.timedelta(minutes=5)
+    assert not TokenManager.in_backoff({'token_next_attempt_at': None})
+    # A fresh stored token can still be used while the next refresh waits.
+    assert not TokenManager.in_backoff({
+        'token_next_attempt_at': later, 'google_access_token': 'token', 'google_token_expiry': later,
+    })
+    assert TokenManager.in_backoff({
+        'token_next_attempt_at': later, 'google_access_token': 'token',
+        'google_token_expiry': utcnow() - datetime.timedelta(minutes=1),
+    })
+    assert TokenManager.in_backoff({'token_next_attempt_at': later})
+    assert not TokenManager.in_backoff({'token_next_attempt_at': utcnow() - datetime.timedelta(seconds=1)})
+
+def test_retry_at_is_epoch_seconds_of_naive_utc():
+    assert TokenManager.retry_at({}) is None
+    assert TokenManager.retry_at({'token_next_attempt_at': datetime.datetime(2025, 1, 1)}) == 1735689600
+
+def test_is_invalid_grant():
+    assert is_invalid_grant(Exception("('invalid_grant: Token has been expired or revoked.', {...})"))
+    assert not is_invalid_grant(Exception("503 Service Unavailable"))
+
+def test_record_failure_passes_invalid_grant_and_keeps_user():
+    db, calendar = FakeDB(), FakeCalendar()
+    manager = TokenManager(db, calendar, Config)
+    manager.record_failure('U1', Exception('invalid_grant'))
+    manager.record_failure('U1', Exception('timed out'))
+    assert db.failures == [('U1', True), ('U1', False)]
+    assert not calendar.evicted and not db.notified
+
+def test_record_failure_evicts_and_announces_dormant_user():
+    db, calendar = FakeDB(dormant=True), FakeCalendar()
+    TokenManager(db, calendar, Config).record_failure('U1', Exception('invalid_grant'))
+    assert calendar.evicted == ['U1']
+    assert db.notified == [('user_dormant', 'U1')]
+
+@pytest.fixture
+def database():
+    """A real Database for the SQL-side rules; needs TEST_DATABASE_DSN pointing at a scratch Postgres."""
+    dsn = os.environ.get('TEST_DATABASE_DSN')
+    if not dsn:
+        pytest.skip("TEST_DATABASE_DSN not set")
+    from psycopg2.extensions import parse_dsn
+    from database import Database
+    params = parse_dsn(dsn)
+    db = Database(params.get('host'), params.get('dbname'), params.get('user'), params.get('password'), port=params.get('port'))
+    db.connect()
+    db.create_tables()
+    yield db
+    db.close()
+
+@pytest.fixture
+def user(database):
+    slack_user_id = f"TEST-{uuid.uuid4().hex[:8]}"
+    database.save_user_tokens(slack_user_id, 'a@example.com', 'a@example.com', 'refresh', None)
+    yield slack_user_id
+    with database._cursor() as cur:
+        cur.execute("DELETE FROM users WHERE slack_user_id = %s", (slack_user_id,))
+
+def fail(database, slack_user_id, now, invalid_grant):
+    return database.record_token_failure(
+        slack_user_id, now, invalid_grant, base_seconds=60, max_seconds=3600, dormant_after=3
+    )
+
+def test_failures_back_off_exponentially_up_to_the_cap(database, user):
+    now = datetime.datetime(2025, 1, 1)
+    delays = []
+    for _ in range(8):
+        fail(database, user, now, invalid_grant=False)
+        delays.append((database.get_user(slack_user_id=user)['token_next_attempt_at'] - now).total_seconds())
+    assert delays == [60, 120, 240, 480, 960, 1920, 3600, 3600]
+    assert database.get_user(slack_user_id=user)['token_dormant_at'] is None
+
+def test_dormant_only_when_the_latest_failure_is_invalid_grant(database, user):
+    now = datetime.datetime(2025, 1, 1)
+    assert fail(database, user, now, invalid_grant=True) == (1, False)
+    assert fail(database, user, now, invalid_grant=True) == (2, False)
+    assert fail(database, user, now, invalid_grant=False) == (3, False)
+    assert fail(database, user, now, invalid_grant=True) == (4, True)
+
+def test_reconnecting_clears_token_state(database, user):
+    now = datetime.datetime(2025, 1, 1)
+    for _ in range(3):
+        fail(database, user, now, invalid_grant=True)
+    database.save_user_tokens(user, 'a@example.com', 'a@example.com', 'new-refresh', None)
+    data = database.get_user(slack_user_id=user)
+    assert (data['token_failure_count'], data['token_next_attempt_at'], data['token_dormant_at']) == (0, None, None)
@@ -0,0 +1,102 @@
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from database import USER_DORMANT_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+def is_invalid_grant(error):
+    """True if Google rejected the refresh token itself (revoked, expired or wrong client)."""
+    return 'invalid_grant' in str(error)
+
+class TokenManager:
+    """
+    Refreshes Google access tokens ahead of expiry, in batches and off the polling path,
+    and stores them with their expiry so pollers find a ready token. Failed refreshes back
+    off exponentially per user; users whose refresh token keeps getting invalid_grant are
+    marked dormant and stop being polled until they connect their calendar again.
+    """
+    def __init__(self, db, google_calendar, config):
+        self.db = db
+        self.google_calendar = google_calendar
+        self.config = config
+
+    def run(self):
+        """Refreshes every token that is due, one claimed batch at a time. Meant to run periodically."""
+        refreshed = failed = 0
+        with ThreadPoolExecutor(max_workers=self.config.TOKEN_REFRESH_CONCURRENCY, thread_name_prefix='token-refresh') as executor:
+            while True:
+                now = datetime.datetime.utcnow()
+                batch = self.db.claim_tokens_to_refresh(
+                    expiring_before=now + datetime.timedelta(minutes=self.config.TOKEN_REFRESH_AHEAD_MINUTES),
+                    now=now,
+                    limit=self.config.TOKEN_REFRESH_BATCH_SIZE,
+                    lease_seconds=self.config.TOKEN_REFRESH_LEASE_SECONDS
+                )
+                if not batch:
+                    break
+                results = executor.map(self._refresh_one, batch)
+                tokens = [token for token in results if token]
+                self.db.save_access_tokens(tokens)
+                refreshed += len(tokens)
+                failed += len(batch) - len(tokens)
+                if len(batch) < self.config.TOKEN_REFRESH_BATCH_SIZE:
+                    break
+        if refreshed or failed:
+            logger.info(f"Token refresh: {refreshed} refreshed, {failed} failed.")
+
+    def _refresh_one(self, user_data):
+        slack_user_id = user_data['slack_user_id']
+        try:
+            token, expiry = self.google_calendar.refresh_access_token(
+                user_data['google_refresh_token'], timeout=self.config.USER_POLL_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            self.record_failure(slack_user_id, e)
+            return None
+        return (slack_user_id, token, expiry)
+
+    def record_failure(self, slack_user_id, error):
+        """Records a failed refresh for the user, from here or from a poller's fallback refresh."""
+        invalid_grant = is_invalid_grant(error)
+        try:
+            failures, dormant = self.db.record_token_failure(
+                slack_user_id, datetime.datetime.utcnow(), invalid_grant,
+                base_seconds=self.config.TOKEN_RETRY_BASE_SECONDS,
+                max_seconds=self.config.TOKEN_RETRY_MAX_SECONDS,
+                dormant_after=self.config.TOKEN_DORMANT_AFTER_FAILURES
+            )
+        except Exception as e:
+            logger.error(f"Error recording token failure for {slack_user_id}: {e}", exc_info=True)
+            return
+        if dormant:
+            logger.warning(f"Refresh token for {slack_user_id} rejected {failures} times; marking dormant until they re-authorize.")
+            self.google_calendar.evict_user(slack_user_id)
+            # The web processes drop their cached "connected" home view for the user.
+            try:
+                self.db.notify(USER_DORMANT_CHANNEL, slack_user_id)
+            except Exception as e:
+                logger.error(f"Error announcing dormant user {slack_user_id}: {e}")
+        else:
+            logger.warning(f"Error refreshing Google token for {slack_user_id} (failure {failures}): {error}")
+
+    @staticmethod
+    def retry_at(user_data):
+        """The user's next refresh attempt as epoch seconds, or None if none is scheduled."""
+        next_attempt_at = user_data.get('token_next_attempt_at')
+        if not next_attempt_at:
+            return None
+        return next_attempt_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+    @staticmethod
+    def in_backoff(user_data):
+        """True if the user's stored token is stale and their next refresh attempt isn't due yet."""
+        next_attempt_at = user_data.get('token_next_attempt_at')
+        if not next_attempt_at:
+            return False
+        now = datetime.datetime.utcnow()
+        expiry = user_data.get('google_token_expiry')
+        if user_data.get('google_access_token') and expiry and expiry > now:
+            return False
+        return next_attempt_at > now
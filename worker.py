@@ -0,0 +1,85 @@
+"""
+Scheduler worker process: polls calendars and posts reminders. Run one or more of these
+next to the web process; users are partitioned across live workers.
+
+    python worker.py
+
+The web process hands work over through Postgres NOTIFY: calendar push notifications
+and newly connected users reach the worker that owns the user. /metrics is served on
+WORKER_METRICS_PORT. SIGUSR1, or POST /admin/profile?target=worker on the web app,
+profiles the next few ticks (see profiler.py).
+"""
+import logging
+import signal
+import sys
+import threading
+
+from prometheus_client import start_http_server
+from slack_sdk import WebClient
+
+from calendar_push import CalendarWatchManager
+from config import Config
+from database import CALENDAR_CHANGED_CHANNEL, PROFILE_CHANNEL, USER_CONNECTED_CHANNEL, Database
+from google_calendar import GoogleCalendar
+from scheduler import MeetingScheduler
+
+logging.basicConfig(level=Config.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+def main():
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+
+    db = Database(
+        Config.DB_HOST, Config.DB_NAME, Config.DB_USER, Config.DB_PASSWORD,
+        min_size=Config.DB_POOL_MIN_SIZE, max_size=Config.DB_POOL_MAX_SIZE,
+        checkout_timeout=Config.DB_POOL_TIMEOUT_SECONDS
+    )
+    db.connect()
+    if not db.pool:
+        return 1
+
+    google_calendar_client = GoogleCalendar(
+        Config.GOOGLE_CLIENT_ID,
+        Config.GOOGLE_CLIENT_SECRET,
+        Config.GOOGLE_REDIRECT_URI,
+        Config.GOOGLE_SCOPES,
+        event_store_max_events=Config.EVENT_STORE_MAX_EVENTS,
+        event_cache_ttl=Config.EVENT_CACHE_TTL_SECONDS
+    )
+    watch_manager = CalendarWatchManager(db, google_calendar_client, Config)
+    slack_client = WebClient(token=Config.SLACK_BOT_TOKEN)
+    scheduler = MeetingScheduler(db, google_calendar_client, slack_client, Config, watch_manager=watch_manager)
+
+    # `kill -USR1 <pid>` profiles the next few ticks without a redeploy.
+    signal.signal(signal.SIGUSR1, lambda *_: scheduler.profiler.arm(Config.PROFILE_DEFAULT_RUNS))
+
+    def on_notification(channel, payload):
+        if channel == USER_CONNECTED_CHANNEL:
+            scheduler.user_connected(payload)
+        elif channel == CALENDAR_CHANGED_CHANNEL and scheduler.membership.owns(payload):
+            logger.info(f"Calendar change notification for {payload}, refreshing.")
+            scheduler.refresh_user(payload)
+        elif channel == PROFILE_CHANNEL:
+            scheduler.profiler.arm(int(payload))
+
+    start_http_server(Config.WORKER_METRICS_PORT)
+    scheduler.start()
+    listener = threading.Thread(
+        target=db.listen,
+        args=((USER_CONNECTED_CHANNEL, CALENDAR_CHANGED_CHANNEL, PROFILE_CHANNEL), on_notification, stop_event),
+        name='pg-listener',
+        daemon=True
+    )
+    listener.start()
+
+    stop_event.wait()
+    logger.info("Shutting down scheduler worker.")
+    scheduler.shutdown()
+    listener.join(timeout=10)
+    db.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())